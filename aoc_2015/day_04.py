@@ -1,33 +1,89 @@
 #!/usr/bin/env python3
 
+import collections
+import itertools
+import os
 import sys
 import traceback
 import hashlib
+from concurrent.futures import ProcessPoolExecutor
 
 from common.utils import *
 
 
-def solve(data, prefix=""):
-    i = 0
-    while True:
-        key = f"{data}{i}"
-        _hash = hashlib.md5(key.encode()).hexdigest()
-        log.debug(f"{i}: {key} => {_hash}")
-        if _hash.startswith(prefix):
+CHUNK_SIZE = 100000
+
+
+def digest_matcher(prefix):
+    """ Return a function that checks if a raw MD5 digest starts with hex string prefix, without hex encoding it """
+    whole = bytes.fromhex(prefix[:len(prefix) - len(prefix) % 2])
+    if len(prefix) % 2 == 0:
+        return lambda digest: digest.startswith(whole)
+    # Odd length prefix: the last hex digit is the high nibble of the next byte
+    index = len(whole)
+    low = int(prefix[-1], 16) << 4
+    high = low + 16
+    return lambda digest: digest.startswith(whole) and low <= digest[index] < high
+
+
+def search_range(data, prefix, start, stop):
+    """ Return the lowest i in [start, stop) where the MD5 of f"{data}{i}" starts with prefix, or None """
+    base = hashlib.md5(data.encode())
+    matches = digest_matcher(prefix)
+    for i in range(start, stop):
+        h = base.copy()
+        h.update(str(i).encode())
+        if matches(h.digest()):
             return i
-        i += 1
+    return None
+
+
+def solve(data, prefix="", start=0, jobs=1, chunk_size=CHUNK_SIZE):
+    """ Find the lowest i >= start where the MD5 of f"{data}{i}" starts with prefix
+        The search is split into chunks of chunk_size. If jobs > 1, chunks are searched over a process pool,
+        and results are checked in chunk order so that the first hit found is the smallest
+    """
+    chunk_starts = itertools.count(start, chunk_size)
+    if jobs <= 1:
+        for chunk_start in chunk_starts:
+            log.debug(f"Searching from {chunk_start}")
+            result = search_range(data, prefix, chunk_start, chunk_start + chunk_size)
+            if result is not None:
+                return result
+
+    with ProcessPoolExecutor(jobs) as executor:
+        # Keep a few chunks queued per worker, in order
+        pending = collections.deque()
+        for chunk_start in itertools.islice(chunk_starts, jobs * 2):
+            pending.append(executor.submit(search_range, data, prefix, chunk_start, chunk_start + chunk_size))
+        while True:
+            result = pending.popleft().result()
+            if result is not None:
+                for future in pending:
+                    future.cancel()
+                return result
+            chunk_start = next(chunk_starts)
+            log.debug(f"Searching from {chunk_start}")
+            pending.append(executor.submit(search_range, data, prefix, chunk_start, chunk_start + chunk_size))
+
+
+def add_args(parser):
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="Worker processes, 0 for one per core")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Numbers searched per task")
 
 
 def main():
-    args = parse_args()
+    args = parse_args(add_args)
     data = open(args.input).read().strip()
+    jobs = args.jobs or os.cpu_count()
 
     log.always("Part 1")
-    result = solve(data, "00000")
+    result = solve(data, "00000", jobs=jobs, chunk_size=args.chunk_size)
     log.always(result)
 
     log.always("Part 2")
-    result = solve(data, "000000")
+    # A hash starting with 000000 also starts with 00000, so resume from part 1
+    result = solve(data, "000000", start=result, jobs=jobs, chunk_size=args.chunk_size)
     log.always(result)
 
 
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import collections
+import functools
 import itertools
 import sys
 import traceback
@@ -7,29 +9,111 @@ import traceback
 from common.utils import *
 
 
+# Number of days over which two neighbouring strings must not interfere for their boundary to be a split
+SPLIT_CHECK_DAYS = 16
+# Digits either side of a boundary used to check whether it splits
+SPLIT_CHECK_WINDOW = 6
+
+
+def look_and_say(val):
+    """ Return the next string in the sequence """
+    return "".join(["{}{}".format(len(list(g)), k) for k, g in itertools.groupby(val)])
+
+
 def iterate(val, n=1, verbose=False):
+    """ Literal engine: build the full string after n iterations. Time and memory grow ~30% per iteration """
     if verbose:
         log.always(f"0: {val}")
     for i in range(n):
-        val = "".join(["{}{}".format(len(list(g)), k) for k, g in itertools.groupby(val)])
+        val = look_and_say(val)
         if verbose:
             log.always(f"{i + 1}: {val}")
     return val
 
 
+@functools.lru_cache(maxsize=None)
+def boundary_splits(left, right):
+    """ Return True if the descendants of left and right do not interfere when they are neighbours
+        This is Conway's splitting of a string into elements, checked directly over SPLIT_CHECK_DAYS days
+    """
+    joined = left + right
+    for _ in range(SPLIT_CHECK_DAYS):
+        left = look_and_say(left)
+        right = look_and_say(right)
+        joined = look_and_say(joined)
+        if left + right != joined:
+            return False
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def split_atoms(val):
+    """ Split val into atoms: substrings whose descendants never interfere with each other """
+    atoms = []
+    start = 0
+    for i in range(1, len(val)):
+        if val[i - 1] == val[i]:
+            continue
+        left = val[max(start, i - SPLIT_CHECK_WINDOW):i]
+        right = val[i:i + SPLIT_CHECK_WINDOW]
+        if boundary_splits(left, right):
+            atoms.append(val[start:i])
+            start = i
+    atoms.append(val[start:])
+    return tuple(atoms)
+
+
+@functools.lru_cache(maxsize=None)
+def decay(atom):
+    """ Return the atoms that atom decays into after one iteration """
+    return split_atoms(look_and_say(atom))
+
+
+def iterate_atoms(val, n=1):
+    """ Element engine: return a Counter of atoms after n iterations of val
+        Sequences quickly decay into a fixed set of Conway's elements, so memory does not grow with n
+    """
+    atoms = collections.Counter(split_atoms(val))
+    for i in range(n):
+        _atoms = collections.Counter()
+        for atom, count in atoms.items():
+            for _atom in decay(atom):
+                _atoms[_atom] += count
+        atoms = _atoms
+        log.debug(f"{i + 1}: {len(atoms)} distinct atoms")
+    return atoms
+
+
+def length_after(val, n, literal=False):
+    """ Return the length of the sequence after n iterations of val """
+    if literal:
+        return len(iterate(val, n))
+    return sum(len(atom) * count for atom, count in iterate_atoms(val, n).items())
+
+
+def add_args(parser):
+    parser.add_argument('-n', '--iterations', type=int, default=None, help="Also report the length after n")
+    parser.add_argument('--literal', action='store_true', help="Build the literal string instead (slow, to verify)")
+
+
 def main():
-    args = parse_args()
+    args = parse_args(add_args)
     val = open(args.input).read().strip()
     n1 = 5 if args.test else 40
     n2 = 50 - n1
 
+    if args.test and args.verbose:
+        iterate(val, n1, True)
+
     log.always("Part 1")
-    _val = iterate(val, n1, args.test and args.verbose)
-    log.always(len(_val))
+    log.always(length_after(val, n1, args.literal))
 
     log.always("Part 2")
-    _val = iterate(_val, n2)
-    log.always(len(_val))
+    log.always(length_after(val, n1 + n2, args.literal))
+
+    if args.iterations is not None:
+        log.always(f"After {args.iterations} iterations")
+        log.always(length_after(val, args.iterations, args.literal))
 
 
 if __name__ == "__main__":
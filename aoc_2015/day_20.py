@@ -4,7 +4,19 @@ import math
 import sys
 import traceback
 
+import numpy as np
+
 from common.utils import *
+from common.benchmark import *
+
+
+PRESENTS_1 = 10
+PRESENTS_2 = 11
+MAX_HOUSES_2 = 50
+# Houses in the first sieve block. Each following block is as large as all the blocks before it
+BLOCK_SIZE = 1 << 16
+# Elves that visit at most this many houses in a block are vectorised
+VECTORISE_VISITS = 32
 
 
 def factors(n):
@@ -14,17 +26,15 @@ def factors(n):
 
 
 def presents_1(_factors):
-    return sum(_factors) * 10
+    return sum(_factors) * PRESENTS_1
 
 
 def presents_2(_factors):
-    return sum([d for d in _factors if _factors[-1] / d <= 50]) * 11
+    return sum([d for d in _factors if _factors[-1] / d <= MAX_HOUSES_2]) * PRESENTS_2
 
 
-def main():
-    args = parse_args()
-    value = int(open(args.input).read())
-
+def solve_trial_division(value):
+    """ Find the first house to get value presents under each rule, factorising every house in turn """
     i = 1
     result_1 = None
     result_2 = None
@@ -35,6 +45,81 @@ def main():
         if result_2 is None and presents_2(_factors) >= value:
             result_2 = i
         i += 1
+    return result_1, result_2
+
+
+def sieve_block(lo, hi):
+    """ Return the presents delivered to houses lo..hi-1 under each rule, as two arrays
+        Elves that visit many houses in the block add their number to a strided slice, one elf at a time.
+        Elves that visit few houses are vectorised: each pass adds one visit from every one of them
+    """
+    size = hi - lo
+    totals_1 = np.zeros(size, dtype=np.int64)
+    totals_2 = np.zeros(size, dtype=np.int64)
+
+    small = min(hi, max(1, size // VECTORISE_VISITS))
+    for elf in range(1, small):
+        # First house in this block visited by elf
+        start = max(elf, -(-lo // elf) * elf)
+        totals_1[start - lo::elf] += elf
+        # Under rule 2 elves stop after MAX_HOUSES_2 houses
+        stop = min(hi, elf * MAX_HOUSES_2 + 1)
+        if start < stop:
+            totals_2[start - lo:stop - lo:elf] += elf
+
+    elves = np.arange(small, hi, dtype=np.int64)
+    houses = np.maximum(elves, -(-lo // elves) * elves)
+    while len(elves):
+        in_block = houses < hi
+        elves = elves[in_block]
+        houses = houses[in_block]
+        totals_1 += np.bincount(houses - lo, weights=elves, minlength=size).astype(np.int64)
+        in_range_2 = houses <= elves * MAX_HOUSES_2
+        totals_2 += np.bincount(houses[in_range_2] - lo, weights=elves[in_range_2], minlength=size).astype(np.int64)
+        houses += elves
+    return totals_1 * PRESENTS_1, totals_2 * PRESENTS_2
+
+
+def solve(value, block_size=BLOCK_SIZE):
+    """ Find the first house to get value presents under each rule, sieving blocks of houses
+        Blocks double in size until both thresholds have been crossed
+    """
+    lo = 1
+    hi = block_size
+    result_1 = None
+    result_2 = None
+    while result_1 is None or result_2 is None:
+        log.info(f"Sieving houses {lo} to {hi - 1}")
+        totals_1, totals_2 = sieve_block(lo, hi)
+        if result_1 is None:
+            hits = np.flatnonzero(totals_1 >= value)
+            if len(hits):
+                result_1 = lo + int(hits[0])
+        if result_2 is None:
+            hits = np.flatnonzero(totals_2 >= value)
+            if len(hits):
+                result_2 = lo + int(hits[0])
+        lo, hi = hi, hi * 2
+    return result_1, result_2
+
+
+def add_args(parser):
+    parser.add_argument('-b', '--benchmark', action='store_true', help="Compare the sieve with trial division")
+
+
+def main():
+    args = parse_args(add_args)
+    value = int(open(args.input).read())
+
+    if args.benchmark:
+        rows = []
+        for name, func in [("trial division", solve_trial_division), ("sieve", solve)]:
+            _, seconds, _ = benchmark(func, value)
+            rows.append((name, seconds, None))
+        log_benchmarks(f"Both parts for {value} presents", rows)
+        return
+
+    result_1, result_2 = solve(value)
 
     log.always("Part 1")
     log.always(result_1)
@@ -5,6 +5,7 @@ import traceback
 import itertools
 
 from common.utils import *
+from common.search import *
 
 
 SPELLS = {
@@ -50,6 +51,10 @@ class State(object):
         """ Make object hashable """
         return full_hash({k: v for k, v in vars(self).items() if not k.startswith("_")})
 
+    def key(self):
+        """ Hashable key of everything but mana_spent, so the same position reached for more mana is one heap entry """
+        return self.player_hp, self.player_mana, self.boss_hp, tuple(sorted(self.spells.items()))
+
     def copy(self, new_spell=None):
         """ Return another copy of self
             Apply new_spell if given, raise StopIteration if new_spell cannot be applied.
@@ -116,16 +121,19 @@ class State(object):
 def solve(data, hard=False):
     start = State(player_hp=50, player_mana=500, boss_hp=data["hit points"], boss_damage=data["damage"], hard=hard)
     explored = set()
-    q = SetHeapQ([start])
+    # Heap of state keys by mana spent, with the cheapest state found so far for each queued key
+    q = IndexedHeap([(start.mana_spent, start.key())])
+    states = {start.key(): start}
     while q:
-        state = q.pop()
+        _, key = q.pop()
+        state = states.pop(key)
         if state.boss_hp <= 0:
             return state.mana_spent
-        explored.add(state)
+        explored.add(key)
         for _state in state.transitions():
-            if _state in explored or _state in q:
-                continue
-            q.push(_state)
+            _key = _state.key()
+            if _key not in explored and q.push(_state.mana_spent, _key):
+                states[_key] = _state
 
 
 def main():
@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 import itertools
+import os
 import sys
 import traceback
-import queue
+from concurrent.futures import ProcessPoolExecutor
 
 from common.utils import *
+from common.benchmark import *
 
 import intcode_vm
 from intcode_vm import *
@@ -17,63 +19,109 @@ intcode_vm.log.debug = log.never
 PHASES_LEN = 5
 
 
-def run_simulation(data, phases, feedback=False):
-    vms = []
+def run_simulation(data, phases, feedback=False, engine=VM):
+    # Load phases
+    channels = [Channel([phase]) for phase in phases]
     if feedback:
-        queues = [queue.Queue() for i in range(len(phases))]
-        final_queue = queues[0]
-        queues.append(final_queue)
+        final_channel = channels[0]
     else:
-        queues = [queue.Queue() for i in range(len(phases) + 1)]
-        final_queue = queues[-1]
-    # Load phases
-    for i, phase in enumerate(phases):
-        queues[i].put(phase)
+        final_channel = Channel()
+    channels.append(final_channel)
     # Load initial power
-    queues[0].put(0)
-    for i, phase in enumerate(phases):
-        vm = VMThread(data, input_queue=queues[i], output_queue=queues[i+1])
-        vms.append(vm)
-    for vm in vms:
-        vm.start()
-    for vm in vms:
-        vm.join()
-    if final_queue.empty():
+    channels[0].put(0)
+    # Run all amplifiers cooperatively in this thread
+    scheduler = Scheduler(
+        engine(data, input_queue=channels[i], output_queue=channels[i+1]) for i in range(len(phases))
+    )
+    if not scheduler.run():
+        log.error(f"Warning: Amplifiers deadlocked with {phases}")
+    if final_channel.empty():
         log.error(f"Warning: No output from from {phases}")
         return None
-    return final_queue.get()
+    return final_channel.get()
+
+
+# Programs and engine for worker processes, shipped once per worker by _init_worker
+_worker_programs = None
+_worker_engine = None
+
+
+def _init_worker(programs, engine):
+    global _worker_programs, _worker_engine
+    _worker_programs = programs
+    _worker_engine = engine
+
+
+def _run_permutation(task):
+    """ Worker: run one phase permutation of one program """
+    i, phases, feedback = task
+    return i, phases, run_simulation(_worker_programs[i], phases, feedback, _worker_engine)
 
 
-def solve(data_file, phases, feedback=False):
+def solve(data_file, phases, feedback=False, engine=VM, jobs=1):
+    """ Find the maximum output over all phase permutations of all programs in data_file
+        If jobs > 1, permutations of every program are run over a pool of jobs worker processes
+    """
+    programs = list(read_csv_int_multiline(data_file, to_list=True))
+    tasks = [(i, _phases, feedback) for i in range(len(programs)) for _phases in itertools.permutations(phases)]
+    if jobs > 1:
+        chunksize = max(1, len(tasks) // (jobs * 4))
+        with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(programs, engine)) as executor:
+            results = list(executor.map(_run_permutation, tasks, chunksize=chunksize))
+    else:
+        results = [(i, _phases, run_simulation(programs[i], _phases, feedback, engine)) for i, _phases, _ in tasks]
+
+    # Reduce results in permutation order, per program
+    best = {}
+    for i, _phases, result_sim in results:
+        log.debug(_phases)
+        if i not in best or result_sim > best[i][0]:
+            best[i] = (result_sim, _phases)
     result = None
-    for i, data in enumerate(read_csv_int_multiline(data_file, to_list=True)):
+    for i, data in enumerate(programs):
         log.always(f"{i}: {list_pretty(data)}")
-
-        phase_permutations = itertools.permutations(phases)
-        result_max = None
-        result_phases = None
-        for phases in phase_permutations:
-            log.debug(phases)
-            result_sim = run_simulation(data, phases, feedback)
-            if result_max is None or result_sim > result_max:
-                result_max = result_sim
-                result_phases = phases
+        result_max, result_phases = best[i]
         log.always(f"{result_max} from phases {result_phases}")
         if result is None or result_max > result:
             result = result_max
     return result
 
 
+def add_args(parser):
+    add_engine_arg(parser)
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="Worker processes, 0 for one per core. Default 1, or with -b one per core and at least 2")
+    parser.add_argument('-b', '--benchmark', action='store_true', help="Compare serial and process pool timings")
+
+
 def main():
-    args = parse_args()
+    args = parse_args(add_args)
+
+    if args.benchmark:
+        # Time the engine itself, not profiled. A pool of 1 would run serially, so use at least 2 workers
+        engine = ENGINES[args.engine]
+        jobs = max(2, args.jobs or os.cpu_count())
+        phases = list(range(5, 5+PHASES_LEN))
+        rows = []
+        for name, _jobs in [("serial", 1), (f"{jobs} processes", jobs)]:
+            _, seconds, _ = benchmark(solve, args.input, phases, True, engine, _jobs, repeat=3)
+            rows.append((name, seconds, None))
+        log_benchmarks("Part 2: serial vs process pool", rows)
+        return
+
+    engine = engine_from_args(args)
+    # Profiles are collected per process, so profile serially
+    jobs = 1 if args.profile else (1 if args.jobs is None else args.jobs or os.cpu_count())
+
     log.always("Part 1:")
     phases = list(range(PHASES_LEN))
-    result = solve(args.input, phases, False)
+    result = solve(args.input, phases, False, engine, jobs)
     log.always(result)
     log.always("Part 2:")
     phases = list(range(5, 5+PHASES_LEN))
-    result = solve(args.input, phases, True)
+    result = solve(args.input, phases, True, engine, jobs)
     log.always(result)
+    report_profile(engine)
 
 
 if __name__ == "__main__":
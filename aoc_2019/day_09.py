@@ -11,24 +11,27 @@ from intcode_vm import *
 
 
 def main():
-    args = parse_args()
+    args = parse_args(add_engine_arg)
+    engine = engine_from_args(args)
     lines = read_lines(args.input)
     data = [list(map(int, line.split(","))) for line in lines]
 
     log.always("Part 1")
     for item in data:
         log.info(list_pretty(item))
-        vm = VM(item, input_queue=[1])
+        vm = engine(item, input_queue=[1])
         vm.run()
         log.always(list(vm.output.queue))
 
     log.always("Part 2")
     for item in data:
         log.info(list_pretty(item))
-        vm = VM(item, input_queue=[2])
+        vm = engine(item, input_queue=[2])
         vm.run()
         log.always(list(vm.output.queue))
 
+    report_profile(engine)
+
 
 if __name__ == "__main__":
     # noinspection PyBroadException
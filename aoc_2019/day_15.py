@@ -44,7 +44,7 @@ def position_move(position, direction):
     return x, y
 
 
-def map_world(data, visualiser=None):
+def map_world(data, visualiser=None, engine=VM):
     """ Part 1: Map the world by creating a VM and using flood filling
         Returns:
             paths: position:distance pairs for every world position that is path
@@ -52,7 +52,7 @@ def map_world(data, visualiser=None):
             oxygen_position: position of oxygen (if found)
             oxygen_vm: VM at oxygen_position (if found)
     """
-    vm = VM(data)
+    vm = engine(data)
     start = (0, 0)
     paths = {start: 0}
     walls = set()
@@ -139,17 +139,19 @@ def simulate(vm, start_position, start_distance, paths, walls, callback):
 
 
 def main():
-    args = parse_args()
+    args = parse_args(add_engine_arg)
     data = read_csv_int(args.input, to_list=True)
     visualiser = Visualiser() if args.verbose else None
 
     log.always("Part 1")
-    paths, walls, oxygen_position, oxygen_vm = map_world(data, visualiser)
+    engine = engine_from_args(args)
+    paths, walls, oxygen_position, oxygen_vm = map_world(data, visualiser, engine)
     if oxygen_position is not None:
         log.always(paths[oxygen_position])
         log.always("Part 2")
         oxygen_paths = flood_oxygen(oxygen_position, oxygen_vm, paths, walls, visualiser)
         log.always(max(oxygen_paths.values()))
+    report_profile(engine)
 
     if visualiser is not None:
         visualiser.check_quit(5)
@@ -7,6 +7,7 @@ import collections
 import numpy as np
 
 from common.utils import *
+from common.search import *
 
 
 def neighbours(pos):
@@ -61,18 +62,17 @@ def simulate_part1(world):
 
     # Dijkstra search for the shortest path to find all keys
     # Track explored paths as combination of location (current location) and found keys
+    # Paths are queued by slug, so a cheaper path to a queued slug replaces it instead of being queued again
     explored = set()
-    path_heads = HeapQ([(0, "@", "")])
+    path_heads = IndexedHeap([(0, path_slug("@", ""))])
+    heads = {path_slug("@", ""): ("@", "")}
     while path_heads:
-        cost, location, keys = path_heads.pop()
+        cost, slug = path_heads.pop()
+        location, keys = heads.pop(slug)
         # Check if all keys have been found
         if set(keys) == all_keys:
             return cost, keys
-        # Check that location has not already been explored with current keys
-        # Create slug from location key and possessed keys. Used to identify non-unique paths
-        if path_slug(location, keys) in explored:
-            continue
-        explored.add(path_slug(location, keys))
+        explored.add(slug)
 
         # Explore all possible locations from location
         for _location, (_path_cost, _locks) in paths[location].items():
@@ -85,7 +85,9 @@ def simulate_part1(world):
             if not set(_locks.lower()).issubset(set(keys)):
                 continue
             # Continue searching from _location
-            path_heads.push((_cost, _location, _keys))
+            _slug = path_slug(_location, _keys)
+            if _slug not in explored and path_heads.push(_cost, _slug):
+                heads[_slug] = (_location, _keys)
     return None, None
 
 
@@ -122,18 +124,18 @@ def simulate_part2(world):
 
     # Dijkstra search for the shortest path to find all keys
     # Track explored paths as combination of location (current location) and found keys
+    # Paths are queued by slug, so a cheaper path to a queued slug replaces it instead of being queued again
     explored = set()
-    path_heads = HeapQ([(0, ["0", "1", "2", "3"], "")])
+    start = ["0", "1", "2", "3"]
+    path_heads = IndexedHeap([(0, path_slug(start, ""))])
+    heads = {path_slug(start, ""): (start, "")}
     while path_heads:
-        cost, locations, keys = path_heads.pop()
+        cost, slug = path_heads.pop()
+        locations, keys = heads.pop(slug)
         # Check if all keys have been found
         if set(keys) == all_keys:
             return cost, keys
-        # Check that location has not already been explored with current keys
-        # Create slug from location key and possessed keys. Used to identify non-unique paths
-        if path_slug(locations, keys) in explored:
-            continue
-        explored.add(path_slug(locations, keys))
+        explored.add(slug)
 
         # Explore all possible locations from location
         for i in range(len(locations)):
@@ -149,7 +151,9 @@ def simulate_part2(world):
                     continue
                 # Continue searching from _location
                 _locations = locations[:i] + [_location] + locations[i+1:]
-                path_heads.push((_cost, _locations, _keys))
+                _slug = path_slug(_locations, _keys)
+                if _slug not in explored and path_heads.push(_cost, _slug):
+                    heads[_slug] = (_locations, _keys)
     return None, None
 
 
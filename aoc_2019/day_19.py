@@ -13,13 +13,14 @@ GRID_SIZE = 100
 
 
 class BeamFinder:
-    def __init__(self, data):
+    def __init__(self, data, engine=VM):
         self.data = data
+        self.engine = engine
         self._row_starts = {}
         self._row_ends = {}
 
     def run_beam(self, x, y):
-        vm = VM(self.data, input_queue=[x, y])
+        vm = self.engine(self.data, input_queue=[x, y])
         return vm.run_until_output()
 
     def row_start(self, y, search_min=None, search_max=None):
@@ -105,9 +106,10 @@ def solve_part2(beam_finder, test=False):
 
 
 def main():
-    args = parse_args()
+    args = parse_args(add_engine_arg)
     data = read_csv_int(args.input, to_list=True)
-    beam_finder = BeamFinder(data)
+    engine = engine_from_args(args)
+    beam_finder = BeamFinder(data, engine)
 
     log.always("Part 1")
     result = solve_part1(beam_finder, verbose=(args.verbose >= 2))
@@ -116,6 +118,7 @@ def main():
     log.always("Part 2")
     result = solve_part2(beam_finder, test=args.test)
     log.always(result)
+    report_profile(engine)
 
 
 if __name__ == "__main__":
@@ -7,6 +7,7 @@ import string
 import numpy as np
 
 from common.utils import *
+from common.search import *
 
 
 START = "AA"
@@ -81,30 +82,35 @@ def find_paths(world, start_pos, destinations):
 
 def solve(start, end, portals, paths, recursive_spaces=False):
     # Dijkstra find shortest path between start and end
+    # Nodes are (pos, level), queued once each: a cheaper route to a queued node lowers its cost in place
     explored = set()
-    path_heads = HeapQ([(0, 0, start, f"{START}:0")])
+    path_heads = IndexedHeap([(0, (start, 0))])
+    path_strs = {(start, 0): f"{START}:0"}
+
+    def push(_cost, _node, _path_str):
+        if _node not in explored and path_heads.push(_cost, _node):
+            path_strs[_node] = _path_str
 
     while path_heads:
-        cost, level, pos, path_str = path_heads.pop()
+        cost, node = path_heads.pop()
+        pos, level = node
+        path_str = path_strs.pop(node)
         _, _, portal_name = portals[pos]
-        if (pos, level) in explored:
-            continue
         log.debug(f"Searching {pos} {portal_name} level {level} cost {cost} via {path_str}")
         if pos == end and level == 0:
             log.info(f"Result: {pos}: {portal_name} {path_str} = {cost}")
             return cost
-        explored.add((pos, level))
+        explored.add(node)
 
         if pos != start and pos != end:
             # Search far end of portal
             _pos, _direction, _portal_name = portals[pos]
             _level = level + (_direction if recursive_spaces else 0)
             if _level >= 0:
-                _path_str = f"{path_str}->{_portal_name}:{_level}"
-                path_heads.push((cost + 1, _level, _pos, _path_str))
+                push(cost + 1, (_pos, _level), f"{path_str}->{_portal_name}:{_level}")
         # Search all locations that can be reached from pos
         for _pos, _cost in paths[pos]:
-            path_heads.push((cost + _cost, level, _pos, path_str))
+            push(cost + _cost, (_pos, level), path_str)
     return
 
 
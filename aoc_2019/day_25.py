@@ -160,8 +160,8 @@ def brute_force_checkpoint(vm, _dir, all_items):
     return None
 
 
-def solve(data):
-    vm = AsciiVM(data)
+def solve(data, vm_class=AsciiVM):
+    vm = vm_class(data)
 
     g = nx.DiGraph()
     _current_node = "start"
@@ -238,18 +238,20 @@ def solve(data):
 
 
 def main():
-    args = parse_args()
+    args = parse_args(add_profile_arg)
     data = read_csv_int(args.input, to_list=True)
+    vm_class = engine_from_args(args, AsciiVM)
 
     if args.test:
         play_manual(data)
         return
 
     log.always("Part 1")
-    result = solve(data)
+    result = solve(data, vm_class)
     log.always("")
     log.always("Result:")
     log.always(result)
+    report_profile(vm_class)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+import itertools
+import os
+import sys
+import traceback
+
+from common.utils import *
+from common.benchmark import *
+from intcode_vm import *
+
+import day_15
+
+
+class CopyCloneVM(VM):
+    """ Baseline VM that keeps its dict memory on clone and copies it in full, instead of sharing pages copy-on-write
+    """
+    def clone(self):
+        new = self.__class__(self.mem)
+        new.ip = self.ip
+        new.relative_base = self.relative_base
+        return new
+
+
+# Engines under test: the selectable engines, plus baselines that only exist for comparison
+BENCH_ENGINES = {
+    **ENGINES,
+    "interpreted-copy-clone": CopyCloneVM,
+}
+
+
+###############################################################################
+# Workloads: each takes a VM engine class and a program, and returns a result that must match across engines
+
+
+def workload_day_02(engine, data):
+    """ Day 2 part 2: search noun/verb pairs, one short VM run per pair """
+    for noun, verb in itertools.product(range(100), repeat=2):
+        vm = engine(data)
+        vm.mem_put(1, noun)
+        vm.mem_put(2, verb)
+        vm.run()
+        if vm.mem_load(0) == 19690720:
+            return noun * 100 + verb
+    return None
+
+
+def workload_day_05(engine, data):
+    """ Day 5 part 2: thermal radiator diagnostics """
+    vm = engine(data, input_queue=[5])
+    vm.run()
+    return list(vm.output.queue)
+
+
+def workload_day_07(engine, data):
+    """ Day 7 part 2: feedback loop over every phase permutation, run serially in one thread """
+    result = None
+    for phases in itertools.permutations(range(5, 10)):
+        vms = [engine(data, input_queue=[phase]) for phase in phases]
+        signal = 0
+        try:
+            while True:
+                for vm in vms:
+                    vm.input.put(signal)
+                    signal = vm.run_until_output()
+        except StopIteration:
+            pass
+        if result is None or signal > result:
+            result = signal
+    return result
+
+
+def workload_day_09(engine, data):
+    """ Day 9 part 2: BOOST sensor mode, a long compute-bound run """
+    vm = engine(data, input_queue=[2])
+    vm.run()
+    return list(vm.output.queue)
+
+
+def workload_day_19(engine, data):
+    """ Day 19 part 1: scan a 50x50 area, one VM per point """
+    result = 0
+    for x, y in itertools.product(range(50), repeat=2):
+        result += engine(data, input_queue=[x, y]).run_until_output()
+    return result
+
+
+def workload_day_15(engine, data):
+    """ Day 15 parts 1 and 2: explore the full maze, cloning the VM at every branch """
+    paths, walls, oxygen_position, oxygen_vm = day_15.map_world(data, engine=engine)
+    oxygen_paths = day_15.flood_oxygen(oxygen_position, oxygen_vm, paths, walls)
+    return paths[oxygen_position], max(oxygen_paths.values())
+
+
+WORKLOADS = {
+    2: workload_day_02,
+    5: workload_day_05,
+    7: workload_day_07,
+    9: workload_day_09,
+    15: workload_day_15,
+    19: workload_day_19,
+}
+
+
+def add_bench_args(parser):
+    parser.add_argument('-r', '--repeat', type=int, default=3, help="Repeats per engine, best time is reported")
+    parser.add_argument('-d', '--day', type=int, choices=WORKLOADS.keys(), action='append', help="Day(s) to run")
+    parser.add_argument('-m', '--memory', action='store_true', help="Also measure peak memory in a separate run")
+
+
+def main():
+    """ Benchmark Intcode VM engines against each other on the 2019 inputs. input is the 2019 input directory """
+    args = parse_args(add_bench_args)
+    for day in args.day or WORKLOADS.keys():
+        workload = WORKLOADS[day]
+        data = read_csv_int(os.path.join(args.input, f"day_{day:02d}_full.txt"), to_list=True)
+        rows = []
+        results = {}
+        for name, engine in BENCH_ENGINES.items():
+            results[name], seconds, _ = benchmark(workload, engine, data, repeat=args.repeat)
+            peak = None
+            if args.memory:
+                _, _, peak = benchmark(workload, engine, data, trace_memory=True)
+            rows.append((name, seconds, peak))
+        log_benchmarks(workload.__doc__.strip(), rows)
+        if len(set(map(repr, results.values()))) != 1:
+            log.error(f"Day {day}: engines disagree: {results}")
+
+
+if __name__ == "__main__":
+    # noinspection PyBroadException
+    try:
+        main()
+    except KeyboardInterrupt:
+        log.always("Killed")
+    except Exception:
+        traceback.print_exc()
+        sys.exit(-1)
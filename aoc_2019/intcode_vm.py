@@ -2,13 +2,16 @@ import operator
 import copy
 import threading
 import queue
-from collections import defaultdict
+from collections import defaultdict, deque
 
 from common.utils import *
 
 
 __all__ = [
-    "VM", "VMThread",
+    "VM", "CompiledVM", "VMThread", "PagedMemory",
+    "Channel", "Scheduler", "Yield",
+    "Profile", "ProfilerMixin", "profiled", "add_profile_arg", "engine_from_args", "report_profile", "disassemble",
+    "ENGINES", "add_engine_arg",
     "list_pretty",
     'Empty'
 ]
@@ -18,6 +21,13 @@ __all__ = [
 Empty = queue.Empty
 
 
+class Yield(Exception):
+    """ Raised from within a VM to suspend it and let a Scheduler run other VMs
+        The VM must raise before changing any state, so that the current instruction is retried when it resumes
+    """
+    pass
+
+
 def list_pretty(data, max_len=6):
     """ String-ify a list. If list has more than max_lem elements, truncate """
     if len(data) < max_len:
@@ -25,15 +35,132 @@ def list_pretty(data, max_len=6):
     return "{} ... {}".format(" ".join(map(str, data[:3])), " ".join(map(str, data[-3:])))
 
 
+class Channel:
+    """ Lightweight FIFO for passing values between VMs in a single thread, backed by a deque
+        Supports the parts of the queue.Queue interface used by VMs, without any locking
+    """
+    def __init__(self, items=None):
+        self.queue = deque(items or ())
+
+    def put(self, item):
+        self.queue.append(item)
+
+    def get(self, block=False, timeout=None):
+        """ Get the next item. Never blocks: raises Empty if there are no items """
+        try:
+            return self.queue.popleft()
+        except IndexError:
+            raise Empty from None
+
+    def empty(self):
+        return not self.queue
+
+    def __len__(self):
+        return len(self.queue)
+
+
+class PagedMemory:
+    """ Sparse memory made of fixed size pages that are shared copy-on-write between forks
+        fork() shares every page with the new memory. A shared page is copied by whichever memory writes to it
+        first, so a fork costs memory proportional to the pages it changes rather than to the program size.
+        Unwritten addresses read as 0
+    """
+    PAGE_BITS = 6
+    PAGE_SIZE = 1 << PAGE_BITS
+    PAGE_MASK = PAGE_SIZE - 1
+
+    def __init__(self, data=None):
+        # All readable pages (page index: list), some of which may be shared with other forks
+        self._pages = {}
+        # Pages owned by this memory, that can be written without copying
+        self._writable = {}
+        if isinstance(data, list):
+            # Slice whole pages, padding the last one with 0
+            for addr in range(0, len(data), self.PAGE_SIZE):
+                page = data[addr:addr + self.PAGE_SIZE]
+                page.extend([0] * (self.PAGE_SIZE - len(page)))
+                self._pages[addr >> self.PAGE_BITS] = page
+            self._writable = self._pages.copy()
+        elif data is not None:
+            for addr, val in data.items():
+                self[addr] = val
+
+    def __getitem__(self, addr):
+        page = self._pages.get(addr >> self.PAGE_BITS)
+        if page is None:
+            return 0
+        return page[addr & self.PAGE_MASK]
+
+    def get(self, addr, default=0):
+        """ As __getitem__, so that a PagedMemory reads like a dict memory. Unwritten addresses read as 0 """
+        page = self._pages.get(addr >> self.PAGE_BITS)
+        if page is None:
+            return 0
+        return page[addr & self.PAGE_MASK]
+
+    def __setitem__(self, addr, val):
+        index = addr >> self.PAGE_BITS
+        page = self._writable.get(index)
+        if page is None:
+            # First write to this page: copy it if it is shared, or create it
+            shared = self._pages.get(index)
+            page = shared.copy() if shared is not None else [0] * self.PAGE_SIZE
+            self._pages[index] = page
+            self._writable[index] = page
+        page[addr & self.PAGE_MASK] = val
+
+    def fork(self):
+        """ Return a new memory sharing all pages with this one. Both memories copy a page on their next write """
+        new = self.__class__.__new__(self.__class__)
+        new._pages = self._pages.copy()
+        new._writable = {}
+        self._writable = {}
+        return new
+
+    def copy(self):
+        """ Return a new memory with private copies of all pages """
+        new = self.__class__.__new__(self.__class__)
+        new._pages = {index: page.copy() for index, page in self._pages.items()}
+        new._writable = new._pages.copy()
+        return new
+
+    def to_list(self):
+        """ Return memory as a flat list, up to the end of the highest allocated page """
+        if not self._pages:
+            return []
+        result = [0] * ((max(self._pages) + 1) * self.PAGE_SIZE)
+        for index, page in self._pages.items():
+            result[index * self.PAGE_SIZE:(index + 1) * self.PAGE_SIZE] = page
+        return result
+
+    @property
+    def page_count(self):
+        """ Number of pages readable by this memory """
+        return len(self._pages)
+
+    @property
+    def private_page_count(self):
+        """ Number of pages owned by this memory and not shared with any fork """
+        return len(self._writable)
+
+
 class VM:
+    # Whether memory starts paged. Otherwise it is a dict until the first clone(), so VMs that are never cloned do
+    # not pay for page lookups
+    PAGED_MEMORY = False
+
     class MODE:
         POSITION = 0
         IMMEDIATE = 1
         RELATIVE = 2
 
     def __init__(self, mem=None, input_queue=None, output_queue=None):
-        # Memory can be infinite and defaults to 0
-        if mem is None:
+        # Memory can be infinite and defaults to 0. Memory from another VM is forked copy-on-write
+        if isinstance(mem, PagedMemory):
+            self.mem = mem.fork()
+        elif self.PAGED_MEMORY and (mem is None or isinstance(mem, (list, dict))):
+            self.mem = PagedMemory(mem)
+        elif mem is None:
             self.mem = {}
         elif isinstance(mem, list):
             self.mem = dict(enumerate(mem))
@@ -44,7 +171,7 @@ class VM:
         self.ip = 0
         self.relative_base = 0
         self.output = output_queue if output_queue is not None else queue.Queue()
-        if isinstance(input_queue, queue.Queue):
+        if isinstance(input_queue, (queue.Queue, Channel)):
             self.input = input_queue
         else:
             self.input = queue.Queue()
@@ -164,7 +291,7 @@ class VM:
             next_ip += 1
             self.relative_base += self.load(mode_1, self.operand(1))
         else:
-            raise RuntimeError(f"Invalid instruction: {self.mem[self.ip]} at {self.ip}")
+            raise RuntimeError(f"Invalid instruction: {self.mem_load(self.ip)} at {self.ip}")
         self.ip = next_ip
 
     def run(self):
@@ -197,13 +324,366 @@ class VM:
     def clone(self):
         """ Create a new VM from this VM
             New VM has new empty input and output queues, but otherwise is identical.
+            Memory pages are shared copy-on-write with the new VM, so cloning is cheap. A dict memory is first
+            converted to pages, once
         """
+        if not isinstance(self.mem, PagedMemory):
+            self.mem = PagedMemory(self.mem)
         new = self.__class__(self.mem)
         new.ip = self.ip
         new.relative_base = self.relative_base
         return new
 
 
+# Page geometry as module constants, which are faster to read than attributes on the CompiledVM hot paths
+_PAGE_BITS = PagedMemory.PAGE_BITS
+_PAGE_SIZE = PagedMemory.PAGE_SIZE
+_PAGE_MASK = PagedMemory.PAGE_MASK
+_NOT_DECODED = [None] * 4
+# Number of parameters per opcode, for checking modes when decoding
+_PARAM_COUNTS = {1: 3, 2: 3, 3: 1, 4: 1, 5: 2, 6: 2, 7: 3, 8: 3, 9: 1, 99: 0}
+
+
+class CompiledVM(VM):
+    """ VM that pre-decodes instructions into a cached instruction table
+        Memory is always a PagedMemory, shared copy-on-write between clones as for VM. Decoded instructions, with their
+        operands, are cached in pages alongside memory and shared copy-on-write in the same way. A write invalidates
+        the cached instructions that read the written address (self-modifying code)
+    """
+    PAGED_MEMORY = True
+
+    def __init__(self, mem=None, input_queue=None, output_queue=None):
+        super().__init__(mem, input_queue, output_queue)
+        # The page table of self.mem, read directly on the hot paths
+        self._pages = self.mem._pages
+        # Decoded (opcode, mode_1, mode_2, mode_3, operand_1, operand_2, operand_3) per page index, as a list with
+        # None where not decoded yet. Pages of this table not in _owned may be shared with a clone
+        self._decoded = {}
+        self._owned = set()
+
+    def _mem_load(self, addr):
+        page = self._pages.get(addr >> _PAGE_BITS)
+        return 0 if page is None else page[addr & _PAGE_MASK]
+
+    def _mem_put(self, addr, val):
+        index = addr >> _PAGE_BITS
+        offset = addr & _PAGE_MASK
+        page = self.mem._writable.get(index)
+        if page is None:
+            # First write to this page: let memory copy or create it
+            self.mem[addr] = val
+        else:
+            page[offset] = val
+        decoded = self._decoded.get(index)
+        if offset >= 3 and index in self._owned:
+            # Fast path: invalidate the instruction at addr and the 3 before it, which could have it as an operand
+            decoded[offset - 3:offset + 1] = _NOT_DECODED
+        elif decoded is not None or (offset < 3 and index and (index - 1) in self._decoded):
+            self._invalidate(addr)
+
+    def _invalidate(self, addr):
+        """ Invalidate the instruction at addr, and those up to 3 before it, copying shared decoded pages """
+        lo = max(addr - 3, 0)
+        for index in range(lo >> _PAGE_BITS, (addr >> _PAGE_BITS) + 1):
+            decoded = self._decoded.get(index)
+            if decoded is None:
+                continue
+            if index not in self._owned:
+                decoded = self._decoded[index] = decoded.copy()
+                self._owned.add(index)
+            base = index << _PAGE_BITS
+            start = max(lo, base) - base
+            stop = min(addr, base + _PAGE_MASK) - base + 1
+            decoded[start:stop] = [None] * (stop - start)
+
+    def decode_instruction(self):
+        """ Decode instruction at self.ip and return opcode and modes, using the cached instruction table """
+        ip = self.ip
+        decoded = self._decoded.get(ip >> _PAGE_BITS)
+        instruction = None if decoded is None else decoded[ip & _PAGE_MASK]
+        if instruction is None:
+            instruction = self._decode(ip)
+        return instruction[:4]
+
+    def _decode(self, addr):
+        """ Decode the instruction at addr, with the 3 words after it as operands, and cache it """
+        index = addr >> _PAGE_BITS
+        offset = addr & _PAGE_MASK
+        page = self._pages.get(index)
+        if page is not None and offset < _PAGE_SIZE - 3:
+            value, p1, p2, p3 = page[offset:offset + 4]
+        else:
+            value, p1, p2, p3 = [self._mem_load(addr + i) for i in range(4)]
+        instruction = (value % 100, value // 100 % 10, value // 1000 % 10, value // 10000 % 10, p1, p2, p3)
+        # Reject bad modes of the parameters in use, as VM does, instead of caching them
+        for mode in instruction[1:1 + _PARAM_COUNTS.get(instruction[0], 0)]:
+            if mode > 2:
+                raise RuntimeError(f"Bad mode {mode}")
+        decoded = self._decoded.get(index)
+        if decoded is None or index not in self._owned:
+            decoded = self._decoded[index] = [None] * _PAGE_SIZE if decoded is None else decoded.copy()
+            self._owned.add(index)
+        decoded[addr & _PAGE_MASK] = instruction
+        return instruction
+
+    def _arg(self, mode, operand):
+        """ Resolve an operand of the current instruction by mode """
+        if mode == 1:
+            return operand
+        addr = operand if mode == 0 else self.relative_base + operand
+        if addr < 0:
+            raise RuntimeError(f"Access negative memory: {self.ip}")
+        page = self._pages.get(addr >> _PAGE_BITS)
+        return 0 if page is None else page[addr & _PAGE_MASK]
+
+    def _store(self, mode, operand, val):
+        """ Store val at the address given by an operand of the current instruction """
+        if mode == 1:
+            raise RuntimeError("Can not put in immediate mode")
+        addr = operand if mode == 0 else self.relative_base + operand
+        if addr < 0:
+            raise RuntimeError(f"Access negative memory: {self.ip}")
+        self._mem_put(addr, val)
+
+    def step(self):
+        ip = self.ip
+        decoded = self._decoded.get(ip >> _PAGE_BITS)
+        instruction = None if decoded is None else decoded[ip & _PAGE_MASK]
+        if instruction is None:
+            instruction = self._decode(ip)
+        opcode, mode_1, mode_2, mode_3, p1, p2, p3 = instruction
+        # Dispatch in rough order of frequency
+        if opcode == 1:
+            self._store(mode_3, p3, self._arg(mode_1, p1) + self._arg(mode_2, p2))
+            self.ip = ip + 4
+        elif opcode == 2:
+            self._store(mode_3, p3, self._arg(mode_1, p1) * self._arg(mode_2, p2))
+            self.ip = ip + 4
+        elif opcode == 5:
+            self.ip = self._arg(mode_2, p2) if self._arg(mode_1, p1) else ip + 3
+        elif opcode == 6:
+            self.ip = ip + 3 if self._arg(mode_1, p1) else self._arg(mode_2, p2)
+        elif opcode == 7:
+            self._store(mode_3, p3, int(self._arg(mode_1, p1) < self._arg(mode_2, p2)))
+            self.ip = ip + 4
+        elif opcode == 8:
+            self._store(mode_3, p3, int(self._arg(mode_1, p1) == self._arg(mode_2, p2)))
+            self.ip = ip + 4
+        elif opcode == 9:
+            self.relative_base += self._arg(mode_1, p1)
+            self.ip = ip + 2
+        elif opcode == 3:
+            # Read input before storing, so that an empty input leaves the VM resumable at this instruction
+            input_value = self._input()
+            self._store(mode_1, p1, input_value)
+            self.ip = ip + 2
+        elif opcode == 4:
+            self._output(self._arg(mode_1, p1))
+            self.ip = ip + 2
+        elif opcode == 99:
+            raise StopIteration
+        else:
+            raise RuntimeError(f"Invalid instruction: {self.mem_load(ip)} at {ip}")
+
+    def clone(self):
+        """ Create a new VM from this VM. Memory pages and their decoded instructions are shared copy-on-write """
+        new = super().clone()
+        new._decoded = self._decoded.copy()
+        # Every decoded page is now shared, so both VMs copy a page before changing it
+        self._owned = set()
+        return new
+
+
+# Available VM engines, selectable by name
+ENGINES = {
+    "interpreted": VM,
+    "compiled": CompiledVM,
+}
+
+
+def add_engine_arg(parser):
+    """ Add --engine and profiling options to an argument parser. Use as parse_args(add_engine_arg) """
+    parser.add_argument('-e', '--engine', choices=ENGINES.keys(), default="compiled", help="Intcode VM engine")
+    add_profile_arg(parser)
+
+
+def add_profile_arg(parser):
+    """ Add --profile and --disassemble options to an argument parser """
+    parser.add_argument('--profile', action='store_true', help="Profile Intcode execution and report hot spots")
+    parser.add_argument('--disassemble', action='store_true', help="Include a disassembly in the profile report")
+
+
+def engine_from_args(args, engine=None):
+    """ Return the VM class selected by args: engine (default: args.engine), profiled if args.profile """
+    if engine is None:
+        engine = ENGINES[args.engine]
+    if args.profile:
+        engine = profiled(engine, disassemble=args.disassemble, report_on_run=False)
+    return engine
+
+
+def report_profile(engine):
+    """ Log the profile report of VM class engine, if it is profiled """
+    if issubclass(engine, ProfilerMixin):
+        engine.profile.report()
+
+
+class Scheduler:
+    """ Run many VMs cooperatively in a single thread
+        VMs are run round-robin. Each runs until it blocks on empty input, raises Yield, or halts. A VM that is
+        blocked on input is not resumed until its input has data. VMs should use Channels for input and output
+    """
+    def __init__(self, vms=()):
+        self.vms = []
+        self.halted = set()
+        self.blocked = set()
+        for vm in vms:
+            self.add(vm)
+
+    def add(self, vm):
+        self.vms.append(vm)
+
+    def run_round(self):
+        """ Give every runnable VM one time slice. Return the number of VMs that ran """
+        ran = 0
+        for vm in self.vms:
+            if vm in self.halted or (vm in self.blocked and vm.input.empty()):
+                continue
+            ran += 1
+            try:
+                while True:
+                    vm.step()
+            except Empty:
+                self.blocked.add(vm)
+            except Yield:
+                self.blocked.discard(vm)
+            except StopIteration:
+                self.blocked.discard(vm)
+                self.halted.add(vm)
+        return ran
+
+    def run(self):
+        """ Run until every VM has halted or is blocked on input. Return True if every VM halted """
+        while self.run_round():
+            pass
+        return len(self.halted) == len(self.vms)
+
+
+# Mnemonic and number of parameters for each opcode
+OPCODES = {
+    1: ("add", 3),
+    2: ("mul", 3),
+    3: ("in", 1),
+    4: ("out", 1),
+    5: ("jnz", 2),
+    6: ("jz", 2),
+    7: ("lt", 3),
+    8: ("eq", 3),
+    9: ("arb", 1),
+    99: ("halt", 0),
+}
+
+
+def disassemble(vm, addr):
+    """ Disassemble the instruction at addr in vm memory. Return (text, instruction length) """
+    value = vm.mem_load(addr)
+    mnemonic, n_params = OPCODES.get(value % 100, (None, 0))
+    if mnemonic is None:
+        return f"data {value}", 1
+    params = []
+    for n in range(1, n_params + 1):
+        mode = value // (10 ** (n + 1)) % 10
+        operand = vm.mem_load(addr + n)
+        if mode == VM.MODE.IMMEDIATE:
+            params.append(str(operand))
+        elif mode == VM.MODE.RELATIVE:
+            params.append(f"[rb{operand:+d}]")
+        else:
+            params.append(f"[{operand}]")
+    return f"{mnemonic:<4} {', '.join(params)}".rstrip(), n_params + 1
+
+
+class Profile:
+    """ Execution counts collected by profiled VMs. One Profile can be shared by many VMs """
+    def __init__(self, disassemble=False, report_on_run=True, top=20):
+        self.disassemble = disassemble
+        self.report_on_run = report_on_run
+        self.top = top
+        self.ip_counts = defaultdict(int)
+        self.opcode_counts = defaultdict(int)
+        # Times execution blocked waiting for input, by ip
+        self.input_waits = defaultdict(int)
+        self.inputs = defaultdict(int)
+        self.outputs = defaultdict(int)
+        # Most recently profiled VM, used to disassemble
+        self.vm = None
+
+    def report(self):
+        """ Log a ranked hot-spot report, and optionally a disassembly of executed code with counts """
+        total = sum(self.ip_counts.values())
+        log.always(f"Intcode profile: {total} instructions at {len(self.ip_counts)} addresses")
+        if not total:
+            return
+        log.always("Opcodes:")
+        for opcode, count in sorted(self.opcode_counts.items(), key=lambda item: -item[1]):
+            mnemonic = OPCODES.get(opcode, (str(opcode),))[0]
+            log.always(f"  {mnemonic:<6} {count:12d} {100 * count / total:6.2f}%")
+        log.always(f"Hot spots (top {self.top}):")
+        for ip, count in sorted(self.ip_counts.items(), key=lambda item: -item[1])[:self.top]:
+            log.always(f"  {ip:6d} {count:12d} {100 * count / total:6.2f}%  {disassemble(self.vm, ip)[0]}")
+        if self.input_waits or self.inputs or self.outputs:
+            log.always("I/O points (reads, waits for input, writes):")
+            for ip in sorted(set(self.input_waits) | set(self.inputs) | set(self.outputs)):
+                log.always(f"  {ip:6d} {self.inputs[ip]:8d} {self.input_waits[ip]:8d} {self.outputs[ip]:8d}")
+        if self.disassemble:
+            log.always("Disassembly of executed code:")
+            for ip in sorted(self.ip_counts):
+                log.always(f"  {ip:6d} {self.ip_counts[ip]:12d}  {disassemble(self.vm, ip)[0]}")
+
+
+class ProfilerMixin:
+    """ Mixin that counts executions per ip and per opcode into the class Profile
+        Use profiled() to create a profiled VM class, so that VMs that are not profiled pay nothing
+    """
+    profile = None
+
+    def step(self):
+        profile = self.profile
+        profile.vm = self
+        ip = self.ip
+        opcode = self.mem_load(ip) % 100
+        halted = False
+        try:
+            super().step()
+        except Empty:
+            profile.input_waits[ip] += 1
+            raise
+        except StopIteration:
+            halted = True
+        profile.ip_counts[ip] += 1
+        profile.opcode_counts[opcode] += 1
+        if opcode == 3:
+            profile.inputs[ip] += 1
+        elif opcode == 4:
+            profile.outputs[ip] += 1
+        if halted:
+            raise StopIteration
+
+    def run(self):
+        super().run()
+        if self.profile.report_on_run:
+            self.profile.report()
+
+
+def profiled(engine, profile=None, **kwargs):
+    """ Return a subclass of VM class engine that records into profile (default: a new Profile(**kwargs))
+        The profile is available as the class attribute profile
+    """
+    if profile is None:
+        profile = Profile(**kwargs)
+    return type(f"Profiled{engine.__name__}", (ProfilerMixin, engine), {"profile": profile})
+
+
 class VMThread(VM, threading.Thread):
     def __init__(self, mem, input_queue=None, output_queue=None, input_timeout=5):
         super().__init__(mem, input_queue, output_queue)
@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 
+import os
 import sys
+import time
 import traceback
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 
 from common.utils import *
+from common.benchmark import *
 
 
 LEN_PART1 = 2020
@@ -25,27 +30,95 @@ def elf_game(initial, max_len):
     return last
 
 
-def run_all_elf_games(data, max_len):
-    def run_elf_game(_data):
-        result = elf_game(_data, max_len)
-        log.always(f"{_data} = {result}")
+def elf_game_array(initial, max_len):
+    """ elf_game with last seen turns in a preallocated array instead of a dict
+        Every number spoken is a difference between two turns, so is below max_len, and the array can be indexed by
+        number directly. Turns are stored plus one, so that 0 means never seen
+    """
+    *_initial, last = initial
+    seen = array('i', bytes(4 * max(max_len, max(initial) + 1)))
+    for i, v in enumerate(_initial):
+        seen[v] = i + 1
+    for turn in range(len(_initial) + 1, max_len):
+        prev = seen[last]
+        seen[last] = turn
+        last = turn - prev if prev else 0
+    return last
+
+
+ENGINES = {
+    "dict": elf_game,
+    "array": elf_game_array,
+}
+
+
+def play_elf_game(engine, initial, max_len):
+    """ Play one game
+        Return (result, seconds, growth in peak RSS of the process during the game in bytes, or None if unknown)
+    """
+    baseline = peak_rss()
+    start = time.perf_counter()
+    result = ENGINES[engine](initial, max_len)
+    seconds = time.perf_counter() - start
+    peak = peak_rss()
+    return result, seconds, None if peak is None else peak - baseline
 
+
+def play_elf_games(games, jobs=1, isolate=False):
+    """ Play each (engine, initial, max_len) in games, yielding results in order
+        If jobs > 1 or isolate, games are played over a process pool with a fresh worker per game, so that the peak
+        memory reported for each game is its own (max_tasks_per_child needs Python 3.11). Otherwise games are played
+        in this process, and a game's peak only counts growth beyond the peak of the games before it
+    """
+    if jobs <= 1 and not isolate:
+        for game in games:
+            yield play_elf_game(*game)
+        return
+    with ProcessPoolExecutor(jobs, max_tasks_per_child=1) as executor:
+        yield from executor.map(play_elf_game, *zip(*games))
+
+
+def run_all_elf_games(data, max_len, engine="array", jobs=1):
     # Run all test input
-    for row in data:
-        run_elf_game(row)
+    games = [(engine, row, max_len) for row in data]
+    for row, (result, seconds, peak) in zip(data, play_elf_games(games, jobs)):
+        log.always(f"{row} = {result}")
+        peak_str = f", peak memory {peak / 1048576:.1f} MiB" if peak is not None else ""
+        log.info(f"  {seconds:.2f} s{peak_str}")
+
+
+def add_args(parser):
+    parser.add_argument('-e', '--engine', choices=ENGINES, default="array", help="Store last seen turns in")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="Worker processes, 0 for one per core")
+    parser.add_argument('-b', '--benchmark', action='store_true',
+                        help="Compare engines on part 2 of the first row, with peak memory")
 
 
 def main():
-    args = parse_args()
+    args = parse_args(add_args)
     data_file = args.input
     lines = read_lines(data_file)
     data = [list(map(int, line.split(","))) for line in lines]
+    jobs = args.jobs or os.cpu_count()
+
+    if args.benchmark:
+        # One game at a time, so that games do not compete for cores, each in its own process to measure its memory
+        games = [(engine, data[0], LEN_PART2) for engine in ENGINES]
+        rows = []
+        results = set()
+        for (engine, _, _), (result, seconds, peak) in zip(games, play_elf_games(games, isolate=True)):
+            rows.append((engine, seconds, peak))
+            results.add(result)
+        log_benchmarks(f"{data[0]} for {LEN_PART2} turns", rows)
+        if len(results) != 1:
+            log.error(f"Engines disagree: {results}")
+        return
 
     log.always("Part 1")
-    run_all_elf_games(data, LEN_PART1)
+    run_all_elf_games(data, LEN_PART1, args.engine, jobs)
 
     log.always("Part 2")
-    run_all_elf_games(data, LEN_PART2)
+    run_all_elf_games(data, LEN_PART2, args.engine, jobs)
 
 
 if __name__ == "__main__":
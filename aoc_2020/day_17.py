@@ -5,10 +5,17 @@ import traceback
 import itertools
 import collections
 
+import numpy as np
+
 from common.utils import *
+from common.benchmark import *
 
 
 N_STEPS = 6
+# (dims, steps, also run the sparse engine) simulated by the benchmark, beyond the puzzle's 6 steps in 3 and 4
+# dimensions. The sparse engine takes minutes for 4 dimensions and 12 steps, so only runs the smaller cases
+BENCHMARK_RUNS = [(3, 6, True), (4, 6, True), (3, 12, True), (4, 12, False), (4, 20, False), (5, 6, False),
+                  (5, 12, False), (6, 6, False)]
 
 
 def parse_input(lines):
@@ -81,6 +88,67 @@ def step_element(state, occupied_neighbours):
     return (state and 2 <= occupied_neighbours <= 3) or (not state and occupied_neighbours == 3)
 
 
+###############################################################################
+# Dense engine: an N-dimensional NumPy array of cells, for any number of dimensions
+
+
+def parse_grid(lines, dims=3):
+    """ Return the starting state as a dims-dimensional array of 0 and 1, the input being the slice of the last 2 axes
+    """
+    if dims < 2:
+        raise ValueError(f"dims must be 2 or more, not {dims}")
+    grid = np.array([[c == "#" for c in line] for line in lines], dtype=np.uint8)
+    return grid.reshape((1,) * (dims - 2) + grid.shape)
+
+
+def crop(grid):
+    """ Return the smallest slice of grid that holds all active cells """
+    if not grid.any():
+        return grid[tuple(slice(0, 0) for _ in grid.shape)]
+    slices = []
+    for axis in range(grid.ndim):
+        other_axes = tuple(a for a in range(grid.ndim) if a != axis)
+        active = np.flatnonzero(grid.any(axis=other_axes))
+        slices.append(slice(active[0], active[-1] + 1))
+    return grid[tuple(slices)]
+
+
+def box_sums(grid):
+    """ Return the sum over the 3x3x...x3 box around every cell of grid, including the cell itself
+        The box is separable, so it is summed one axis at a time from three shifted slices: N passes over the array
+        rather than 3^N. Cells outside grid count as 0
+    """
+    # Sums reach 3^N, so use the smallest type that holds that
+    dtype = np.min_scalar_type(3 ** grid.ndim)
+    sums = grid.astype(dtype)
+    for axis in range(grid.ndim):
+        padding = [(0, 0)] * grid.ndim
+        padding[axis] = (1, 1)
+        padded = np.pad(sums, padding)
+        size = padded.shape[axis]
+        sums = (padded.take(range(0, size - 2), axis) + padded.take(range(1, size - 1), axis)
+                + padded.take(range(2, size), axis))
+    return sums
+
+
+def step_dense(grid):
+    """ Run one step of the simulation over an array of cells, returning the new array cropped to its active cells """
+    # Cells can only become active next to an active cell, so grow the bounding box by 1 on every side
+    grid = np.pad(grid, 1)
+    sums = box_sums(grid)
+    # Sums include the cell: active cells stay active with 2 or 3 neighbours, inactive cells activate with 3
+    grid = (sums == 3) | ((grid == 1) & (sums == 4))
+    return crop(grid.astype(np.uint8))
+
+
+def run_simulation_dense(grid, n_steps):
+    """ Run the simulation with starting array grid for n_steps, and return the number of active cells """
+    for i in range(n_steps):
+        grid = step_dense(grid)
+        log.info(f"Step {i + 1}: {' * '.join(map(str, grid.shape))}, {int(grid.sum())} active")
+    return int(grid.sum())
+
+
 ###############################################################################
 # Utilities - print
 
@@ -128,18 +196,60 @@ def get_limit(data, axis):
 ###############################################################################
 
 
+def run_benchmarks(lines):
+    """ Compare the engines over BENCHMARK_RUNS """
+    for dims, n_steps, sparse in BENCHMARK_RUNS:
+        rows = []
+        results = set()
+        if sparse:
+            result, seconds, _ = benchmark(run_simulation, parse_input(lines), n_steps, dims == 4)
+            rows.append(("sparse", seconds, None))
+            results.add(result)
+        result, seconds, _ = benchmark(run_simulation_dense, parse_grid(lines, dims), n_steps)
+        rows.append(("dense", seconds, None))
+        results.add(result)
+        log_benchmarks(f"{dims} dimensions, {n_steps} steps: {result} active", rows)
+        if len(results) != 1:
+            log.error(f"Engines disagree: {results}")
+
+
+def add_args(parser):
+    parser.add_argument('-n', '--steps', type=int, default=N_STEPS, help="Steps to simulate")
+    parser.add_argument('--dims', type=int, default=None,
+                        help="Also simulate in this many dimensions, 3 or more")
+    parser.add_argument('--sparse', action='store_true', help="Use the sparse engine (3 and 4 dimensions only)")
+    parser.add_argument('-b', '--benchmark', action='store_true', help="Compare the engines over more steps and dims")
+
+
 def main():
-    args = parse_args()
+    args = parse_args(add_args)
+    # As argparse does for bad arguments
+    if args.dims is not None and args.dims < 3:
+        log.error(f"--dims must be 3 or more, not {args.dims}")
+        sys.exit(2)
+    if args.sparse and args.dims not in (None, 3, 4):
+        log.error(f"--sparse only simulates 3 or 4 dimensions, not --dims {args.dims}")
+        sys.exit(2)
     data_file = args.input
-    lines = read_lines(data_file)
-    data = parse_input(lines)
+    lines = read_lines(data_file, to_list=True)
+
+    if args.benchmark:
+        run_benchmarks(lines)
+        return
+
+    def simulate(dims):
+        if args.sparse:
+            return run_simulation(parse_input(lines), args.steps, dims == 4, args.verbose > 0, args.verbose > 1)
+        return run_simulation_dense(parse_grid(lines, dims), args.steps)
 
     log.always("Part 1")
-    result = run_simulation(data, N_STEPS, False, args.debug, args.verbose)
-    log.always(result)
+    log.always(simulate(3))
     log.always("Part 2")
-    result = run_simulation(data, N_STEPS, True, args.debug, args.verbose)
-    log.always(result)
+    log.always(simulate(4))
+
+    if args.dims is not None:
+        log.always(f"{args.dims} dimensions")
+        log.always(simulate(args.dims))
 
 
 if __name__ == "__main__":
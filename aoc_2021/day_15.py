@@ -1,11 +1,19 @@
 #!/usr/bin/env python3
 
+import array
 import sys
 import traceback
 
 import numpy as np
 
 from common.utils import *
+from common.benchmark import *
+from common.search import *
+
+
+MAX_RISK = 9
+# Part 2 tiles the cave this many times in each direction
+TILES = 5
 
 
 DIRS = [
@@ -27,6 +35,11 @@ def in_bounds_2d(c, limits):
 
 
 def find_best_path(grid):
+    """ Find the best path from top-left to bottom-right of grid, using A* over flat cell indices """
+    return grid_search(grid, [(0, 0)], (grid.shape[0] - 1, grid.shape[1] - 1))
+
+
+def find_best_path_heapq(grid):
     """ Use Dijkstra's algorithm to find the best path from top-left to bottom-right of grid """
     limits = add_2d(grid.shape, (-1, -1))
     start = (0, 0)
@@ -49,9 +62,49 @@ def find_best_path(grid):
                     path_heads.push((_score, _position))
 
 
+def find_best_path_tiled(grid, tiles=TILES):
+    """ Find the best path across grid tiled tiles times in each direction, without building the tiled grid
+        The risk of a cell is computed from grid as it is entered. Cells are flat indices, best costs are kept in a flat
+        int array, and the frontier is a BucketQueue (Dial's algorithm), so memory grows only with the number of cells
+    """
+    height, width = grid.shape
+    rows = height * tiles
+    columns = width * tiles
+    base = grid.ravel().tolist()
+    # Per row and column: offset into base, and tile number
+    row_offsets = [(row % height) * width for row in range(rows)]
+    row_tiles = [row // height for row in range(rows)]
+    column_offsets = [column % width for column in range(columns)]
+    column_tiles = [column // width for column in range(columns)]
+
+    goal = rows * columns - 1
+    # No path can cost more than entering every cell at the highest risk
+    unreached = MAX_RISK * rows * columns + 1
+    best = array.array("i" if unreached < 2 ** 31 else "q", [unreached]) * (rows * columns)
+    best[0] = 0
+    queue = BucketQueue([(0, 0)])
+    while queue:
+        cost, index = queue.pop()
+        if best[index] != cost:
+            # Stale: index was reached more cheaply and has already been expanded
+            continue
+        if index == goal:
+            return cost
+        row, column = divmod(index, columns)
+        for _row, _column in ((row + 1, column), (row, column + 1), (row - 1, column), (row, column - 1)):
+            if 0 <= _row < rows and 0 <= _column < columns:
+                risk = base[row_offsets[_row] + column_offsets[_column]] + row_tiles[_row] + column_tiles[_column]
+                _cost = cost + (risk - 1) % MAX_RISK + 1
+                _index = _row * columns + _column
+                if _cost < best[_index]:
+                    best[_index] = _cost
+                    queue.push(_cost, _index)
+    return None
+
+
 def grid_part_2(grid):
     """ Construct new grid that is 5 times the size of original grid """
-    repeats = 5
+    repeats = TILES
     _grid = np.zeros(np.array(grid.shape) * repeats, dtype=int)
     _x, _y = grid.shape
     for x in range(repeats):
@@ -61,19 +114,45 @@ def grid_part_2(grid):
     return _grid
 
 
+def add_args(parser):
+    parser.add_argument('-b', '--benchmark', action='store_true', help="Compare search implementations")
+    parser.add_argument('--tiles', type=int, default=None, help="Also find the best path with the cave tiled n times")
+
+
 def main():
-    args = parse_args()
+    args = parse_args(add_args)
     lines = read_lines(args.input)
     grid = np.array([list(map(int, line)) for line in lines], dtype=int)
 
+    if args.benchmark:
+        for title, tiles in [("Part 1", 1), ("Part 2", TILES)]:
+            _grid = grid_part_2(grid) if tiles > 1 else grid
+            rows = []
+            for name, func, _args in [
+                ("heapq tuples", find_best_path_heapq, (_grid,)),
+                ("common.search", find_best_path, (_grid,)),
+                ("lazy tiles", find_best_path_tiled, (grid, tiles)),
+            ]:
+                _, seconds, _ = benchmark(func, *_args)
+                # Tracing slows the search down, so measure memory in a separate run
+                _, _, peak = benchmark(func, *_args, trace_memory=True)
+                rows.append((name, seconds, peak))
+            log_benchmarks(title, rows)
+        return
+
     log.always("Part 1:")
     result = find_best_path(grid)
     log.always(result)
 
     log.always("Part 2:")
-    result = find_best_path(grid_part_2(grid))
+    result = find_best_path_tiled(grid)
     log.always(result)
 
+    if args.tiles is not None:
+        log.always(f"Tiled {args.tiles}x:")
+        result = find_best_path_tiled(grid, args.tiles)
+        log.always(result)
+
 
 if __name__ == "__main__":
     # noinspection PyBroadException
@@ -8,6 +8,22 @@ import itertools
 import numpy as np
 
 from common.utils import *
+from common.benchmark import *
+
+
+# Beacons two scanners must share to be aligned
+MATCH_BEACONS = 12
+# Pairwise distances shared by two scanners that share MATCH_BEACONS beacons
+MATCH_DISTANCES = MATCH_BEACONS * (MATCH_BEACONS - 1) // 2
+# Scanners see beacons at most this far away along each axis
+SCANNER_RANGE = 1000
+# Shared distances used to guess the rotation of a scanner before histogramming offsets
+ROTATION_PROBES = 4
+# Bias added to coordinate differences before packing them into one int. Must exceed any absolute difference
+PACK_BIAS = 1 << 20
+# Lattice overlaps of generated scanners: shared beacons are picked from LATTICE_SIDE**3 points LATTICE_SPACING apart
+LATTICE_SIDE = 4
+LATTICE_SPACING = SCANNER_RANGE // 10
 
 
 # All 24 possible 90* rotations for a 3d object
@@ -39,6 +55,9 @@ ROTATIONS = [
 ]
 
 
+ROTATION_STACK = np.array(ROTATIONS)
+
+
 def rotate(coords, rotation):
     """ Rotate all coordinates in coords by rotation """
     return np.matmul(coords, rotation)
@@ -99,18 +118,213 @@ def find_match(known_sensors, unknown_sensors, sensor_offsets, tried):
     return False
 
 
-def parse_block(lines):
-    """ Parse a block of lines from input. A block contains information from a single sensor """
-    _id = int(lines[0].split(" ")[2])
-    beacons_dist = np.array([list(map(int, line.split(","))) for line in lines[1:]])
-    return _id, beacons_dist
+def pair_distances(coords):
+    """ Return (i, j, squared distance) for every pair of beacons i < j in coords, sorted by distance
+        Distances do not depend on the orientation or position of the scanner
+    """
+    i, j = np.triu_indices(len(coords), 1)
+    distances = np.sum((coords[i] - coords[j]) ** 2, axis=1)
+    order = np.argsort(distances)
+    return i[order], j[order], distances[order]
 
 
-def main():
-    args = parse_args()
-    data_text = read_multilines(args.input)
-    data = dict([parse_block(lines) for lines in data_text])
+def fingerprint(coords):
+    """ Return (i, j, distances, set of distances): pair_distances(coords), and its distances as a set """
+    i, j, distances = pair_distances(coords)
+    return i, j, distances, set(distances.tolist())
+
+
+def fingerprint_neighbours(fingerprints):
+    """ Return {id: set of ids} of scanners that share at least MATCH_DISTANCES pairwise distances
+        fingerprints is {id: fingerprint(coords)}. The distances of all scanners are sorted together, so equal
+        distances from different scanners are adjacent, and pairs of scanners are counted without comparing every
+        scanner with every other
+    """
+    distances = []
+    ids = []
+    for _id, (_, _, _distances, _) in fingerprints.items():
+        _distances = np.unique(_distances)
+        distances.append(_distances)
+        ids.append(np.full(len(_distances), _id))
+    distances = np.concatenate(distances)
+    ids = np.concatenate(ids)
+    order = np.argsort(distances, kind="stable")
+    distances = distances[order]
+    ids = ids[order]
+    # Each scanner contributes a distance at most once, so runs of equal distances are short: pair every entry with
+    # the one step places on, until no runs are that long. Pairs are packed into ints to be counted
+    span = int(ids.max()) + 1
+    pairs = []
+    step = 1
+    while True:
+        same = distances[step:] == distances[:-step]
+        if not same.any():
+            break
+        a = ids[:-step][same]
+        b = ids[step:][same]
+        pairs.append(np.minimum(a, b) * span + np.maximum(a, b))
+        step += 1
+    neighbours = collections.defaultdict(set)
+    if pairs:
+        pairs, counts = np.unique(np.concatenate(pairs), return_counts=True)
+        for pair in pairs[counts >= MATCH_DISTANCES].tolist():
+            a, b = divmod(pair, span)
+            neighbours[a].add(b)
+            neighbours[b].add(a)
+    return neighbours
+
+
+def shared_beacons(fingerprint, count, distances):
+    """ Return a mask of the count beacons of fingerprint at one end of a pair whose distance is in set distances """
+    i, j, _distances, _ = fingerprint
+    # Sorted needles keep searchsorted cache friendly
+    shared = np.sort(np.fromiter(distances, dtype=_distances.dtype, count=len(distances)))
+    # Distances are sorted, so each shared distance covers one range of pairs: count where ranges open and close
+    opened = np.bincount(np.searchsorted(_distances, shared, "left"), minlength=len(_distances) + 1)
+    closed = np.bincount(np.searchsorted(_distances, shared, "right"), minlength=len(_distances) + 1)
+    hit = np.cumsum(opened[:-1] - closed[:-1]) > 0
+    mask = np.zeros(count, dtype=bool)
+    mask[i[hit]] = True
+    mask[j[hit]] = True
+    return mask
+
+
+def pack(coords):
+    """ Pack integer coordinate differences into one int each, so they can be histogrammed """
+    coords = coords + PACK_BIAS
+    return (coords[..., 0] * (2 * PACK_BIAS) + coords[..., 1]) * (2 * PACK_BIAS) + coords[..., 2]
+
+
+def probe_rotations(known_coords, known_fingerprint, coords, fingerprint, shared):
+    """ Return the rotations that turn a pair of beacons in coords into a pair in known_coords at the same distance
+        Up to ROTATION_PROBES shared distances that occur once on each side are tried. A distance shared by chance
+        gives a wrong rotation, so the result is a set of candidates to check, not an answer
+    """
+    known_i, known_j, known_distances, _ = known_fingerprint
+    i, j, distances, _ = fingerprint
+    rotations = set()
+    probes = 0
+    for distance in shared:
+        k = np.searchsorted(known_distances, distance)
+        u = np.searchsorted(distances, distance)
+        if known_distances[k + 1:k + 2].tolist() == [distance] or distances[u + 1:u + 2].tolist() == [distance]:
+            # Ambiguous: more than one pair on a side at this distance
+            continue
+        known_vector = known_coords[known_j[k]] - known_coords[known_i[k]]
+        rotated = (coords[j[u]] - coords[i[u]]) @ ROTATION_STACK
+        # The pair may be listed the other way round on one side
+        rotations.update(np.flatnonzero(np.all(rotated == known_vector, axis=1) |
+                                        np.all(rotated == -known_vector, axis=1)).tolist())
+        probes += 1
+        if probes == ROTATION_PROBES:
+            break
+    return sorted(rotations)
 
+
+def histogram_offsets(known_coords, coords, rotations):
+    """ Find a rotation from rotations and an offset that put at least MATCH_BEACONS of coords on known_coords
+        The difference between every known beacon and every rotated beacon is histogrammed for all rotations at once:
+        the offset of a match is a difference that occurs MATCH_BEACONS times.
+        Return (rotation, offset), or (None, None)
+    """
+    # (rotation, beacon, axis)
+    rotated = np.einsum("bj,rjk->rbk", coords, ROTATION_STACK[rotations])
+    # (rotation, known beacon * beacon)
+    differences = pack(known_coords[None, :, None, :] - rotated[:, None, :, :]).reshape(len(rotations), -1)
+    for r, rotation in enumerate(rotations):
+        values, counts = np.unique(differences[r], return_counts=True)
+        best = np.argmax(counts)
+        if counts[best] >= MATCH_BEACONS:
+            # Recover the offset from any beacon pair that produced it
+            k, b = divmod(int(np.flatnonzero(differences[r] == values[best])[0]), len(coords))
+            return rotation, known_coords[k] - rotated[r, b]
+    return None, None
+
+
+def align(sources, coords, fingerprint, exhaustive=False):
+    """ Find the rotation and offset of coords that puts at least MATCH_BEACONS of them on known beacons
+        sources is a list of (known coords, fingerprint), matched as one union. Only beacons with a pairwise distance
+        found on the other side can match, so both sides are pruned to those. Rotations suggested by shared distances
+        are histogrammed first, then the rest.
+        Distances are compared as sets, so beacons whose pairwise distances repeat share fewer than MATCH_DISTANCES
+        of them even when they match. If exhaustive, fingerprints are not used: every known beacon and every beacon
+        of coords are histogrammed over all rotations.
+        Return (offset, rotated and shifted coords), or (None, None)
+    """
+    if exhaustive:
+        known_coords = np.unique(np.concatenate([known_coords for known_coords, _ in sources]), axis=0)
+        rotation, offset = histogram_offsets(known_coords, coords, list(range(len(ROTATIONS))))
+        if rotation is None:
+            return None, None
+        return offset, coords @ ROTATIONS[rotation] + offset
+    known_candidates = []
+    mask = np.zeros(len(coords), dtype=bool)
+    rotations = set()
+    for known_coords, known_fingerprint in sources:
+        shared = known_fingerprint[3] & fingerprint[3]
+        if len(shared) < MATCH_DISTANCES:
+            continue
+        known_candidates.append(known_coords[shared_beacons(known_fingerprint, len(known_coords), shared)])
+        mask |= shared_beacons(fingerprint, len(coords), shared)
+        if not rotations:
+            rotations.update(probe_rotations(known_coords, known_fingerprint, coords, fingerprint, shared))
+    if not known_candidates:
+        return None, None
+    known_candidates = np.unique(np.concatenate(known_candidates), axis=0)
+    candidates = coords[mask]
+    if len(known_candidates) < MATCH_BEACONS or len(candidates) < MATCH_BEACONS:
+        return None, None
+    rotations = sorted(rotations)
+    for _rotations in [rotations, [r for r in range(len(ROTATIONS)) if r not in rotations]]:
+        if not _rotations:
+            continue
+        rotation, offset = histogram_offsets(known_candidates, candidates, _rotations)
+        if rotation is not None:
+            return offset, coords @ ROTATIONS[rotation] + offset
+    return None, None
+
+
+def solve(data):
+    """ Align every scanner to scanner 0. Return (set of beacon tuples, {id: scanner position})
+        Scanners are only aligned to known scanners they share a fingerprint with, and each one is matched in one
+        pass against the union of the beacons of all of its aligned fingerprint neighbours. If that runs out, the
+        remaining scanners are matched against the union of every aligned beacon, without fingerprints
+    """
+    # Distances do not change when a scanner is aligned, so one fingerprint per scanner serves throughout
+    fingerprints = {_id: fingerprint(coords) for _id, coords in data.items()}
+    neighbours = fingerprint_neighbours(fingerprints)
+    known = {0: data[0]}
+    positions = {0: np.array([0, 0, 0])}
+    unknown = set(data) - {0}
+    queue = collections.deque([0])
+    while unknown:
+        fallback = not queue
+        if fallback:
+            # Fingerprints missed a match: try everything left against every known beacon
+            log.info(f"No fingerprint matches for {len(unknown)} scanners, trying all known beacons")
+            candidates = set(unknown)
+        else:
+            candidates = neighbours[queue.popleft()] & unknown
+        for _id in sorted(candidates):
+            sources = [(known[i], fingerprints[i]) for i in (known if fallback else neighbours[_id] & known.keys())]
+            offset, coords = align(sources, data[_id], fingerprints[_id], fallback)
+            if offset is not None:
+                log.info(f"Match found: {_id} at {offset}")
+                known[_id] = coords
+                positions[_id] = offset
+                unknown.remove(_id)
+                queue.append(_id)
+        if fallback and not queue:
+            log.error("Unable to match any more sensors?")
+            break
+    beacons = set(map(tuple, np.concatenate(list(known.values())).tolist()))
+    return beacons, positions
+
+
+def solve_pairwise(data):
+    """ Align every scanner to scanner 0, trying each rotation and beacon offset for each pair of scanners in turn
+        Return (set of beacon tuples, {id: scanner position})
+    """
     known_sensors = {0: data[0]}
     sensor_offsets = {0: np.array([0, 0, 0])}
     unknown_sensors = {_id: coords for _id, coords in data.items() if _id not in known_sensors}
@@ -119,26 +333,114 @@ def main():
         if not find_match(known_sensors, unknown_sensors, sensor_offsets, tried):
             log.error("Unable to match any more sensors?")
             break
+    beacons = set(map(tuple, np.concatenate(list(known_sensors.values())).tolist()))
+    return beacons, sensor_offsets
+
+
+def largest_distance(positions):
+    """ Return the largest Manhattan distance between any two scanner positions """
+    positions = np.array(list(positions.values()))
+    return int(np.abs(positions[:, None, :] - positions[None, :, :]).sum(axis=2).max())
+
+
+def generate_scanners(count, seed=0, lattice=False):
+    """ Generate count scanners in the input format, as {id: beacon coords relative to the scanner}
+        Return (scanners, every beacon seen by a scanner, scanner positions)
+        Each scanner overlaps the range of one of the last few, is rotated randomly, and is guaranteed to share at least
+        MATCH_BEACONS beacons with it. Other beacons are scattered at about the density of the puzzle input
+        If lattice, the beacons a scanner shares with the one it overlaps are instead MATCH_BEACONS points of a small
+        lattice. Their pairwise distances repeat, so the scanners share fewer than MATCH_DISTANCES distinct distances
+    """
+    rng = np.random.default_rng(seed)
+    positions = [np.zeros(3, dtype=int)]
+    parents = [None]
+    for i in range(1, count):
+        # Branch off one of the last few scanners, stepping most of a range along every axis, so the scanners spread
+        # out instead of piling up around scanner 0
+        parent = int(rng.integers(max(0, i - 3), i))
+        step = rng.integers(SCANNER_RANGE * 3 // 5, SCANNER_RANGE * 6 // 5 + 1, 3) * rng.choice([-1, 1], 3)
+        positions.append(positions[parent] + step)
+        parents.append(parent)
+    positions = np.array(positions)
+    low = positions.min(axis=0) - SCANNER_RANGE
+    high = positions.max(axis=0) + SCANNER_RANGE
+    # About 26 beacons per scanner cube
+    volume = np.prod((high - low + 1).astype(float))
+    beacons = np.unique(rng.integers(low, high + 1, (int(volume * 26 / (2 * SCANNER_RANGE) ** 3), 3)), axis=0)
+    extra = []
+    for i, parent in enumerate(parents):
+        if parent is None:
+            continue
+        # Add beacons to the overlap of scanner and parent until they share enough
+        _low = np.maximum(positions[i], positions[parent]) - SCANNER_RANGE
+        _high = np.minimum(positions[i], positions[parent]) + SCANNER_RANGE
+        overlap = np.all((_low <= beacons) & (beacons <= _high), axis=1)
+        if lattice:
+            beacons = beacons[~overlap]
+            points = np.array(list(itertools.product(range(LATTICE_SIDE), repeat=3)))
+            points = points[rng.choice(len(points), MATCH_BEACONS, replace=False)] * LATTICE_SPACING
+            extra.append(rng.integers(_low, _high - (LATTICE_SIDE - 1) * LATTICE_SPACING + 1) + points)
+            continue
+        shared = np.count_nonzero(overlap)
+        if shared < MATCH_BEACONS:
+            extra.append(rng.integers(_low, _high + 1, (MATCH_BEACONS - shared, 3)))
+    # Duplicates could leave an overlap one beacon short, but are vanishingly unlikely at this density
+    beacons = np.unique(np.concatenate([beacons] + extra), axis=0)
+    data = {}
+    seen = np.zeros(len(beacons), dtype=bool)
+    for i, position in enumerate(positions):
+        visible = np.all(np.abs(beacons - position) <= SCANNER_RANGE, axis=1)
+        seen |= visible
+        # Undo a random rotation: rotating by rotation recovers coordinates relative to scanner 0
+        rotation = np.identity(3, dtype=int) if i == 0 else ROTATIONS[int(rng.integers(len(ROTATIONS)))]
+        data[i] = (beacons[visible] - position) @ rotation.T
+    return data, beacons[seen], positions
+
+
+def parse_block(lines):
+    """ Parse a block of lines from input. A block contains information from a single sensor """
+    _id = int(lines[0].split(" ")[2])
+    beacons_dist = np.array([list(map(int, line.split(","))) for line in lines[1:]])
+    return _id, beacons_dist
+
+
+def add_args(parser):
+    parser.add_argument('-b', '--benchmark', action='store_true', help="Compare with pairwise alignment")
+    parser.add_argument('--synthetic', type=int, default=None, help="Solve n generated scanners instead of input")
+    parser.add_argument('--lattice', action='store_true',
+                        help="With --synthetic, overlap scanners on lattice points, whose distances repeat")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for --synthetic")
+
+
+def main():
+    args = parse_args(add_args)
+    if args.synthetic is not None:
+        data, expected_beacons, expected_positions = generate_scanners(args.synthetic, args.seed, args.lattice)
+        log.always(f"Generated {len(data)} scanners, {len(expected_beacons)} beacons")
+    else:
+        data_text = read_multilines(args.input)
+        data = dict([parse_block(lines) for lines in data_text])
+
+    if args.benchmark:
+        rows = []
+        for name, func in [("pairwise", solve_pairwise), ("fingerprints", solve)]:
+            (beacons, positions), seconds, _ = benchmark(func, data)
+            rows.append((name, seconds, None))
+            log.always(f"  {name}: {len(beacons)} beacons, largest distance {largest_distance(positions)}")
+        log_benchmarks(f"Aligning {len(data)} scanners", rows)
+        return
+
+    beacons, positions = solve(data)
+    if args.synthetic is not None:
+        if beacons != set(map(tuple, expected_beacons.tolist())) or any(
+                (positions.get(i, None) != position).any() for i, position in enumerate(expected_positions)):
+            log.error("Synthetic scanners were not reconstructed")
 
     log.always("Part 1:")
-    total_sensors = np.unique(
-        np.concatenate(
-            [coords for coords in known_sensors.values()],
-            axis=0
-        ),
-        axis=0
-    ).shape[0]
-    log.always(total_sensors)
+    log.always(len(beacons))
 
     log.always("Part 2:")
-    distance_largest = 0
-    _sensor_offsets = list(sensor_offsets.values())
-
-    for i, coord_a in enumerate(_sensor_offsets):
-        for coord_b in _sensor_offsets[i+1:]:
-            distance = np.sum(np.abs(coord_b - coord_a))
-            distance_largest = max(distance_largest, distance)
-    log.always(distance_largest)
+    log.always(largest_distance(positions))
 
 
 if __name__ == "__main__":
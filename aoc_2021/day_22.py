@@ -1,10 +1,27 @@
 #!/usr/bin/env python3
+import itertools
 import re
 import sys
 import traceback
 from collections import defaultdict
 
+import numpy as np
+
 from common.utils import *
+from common.benchmark import *
+
+
+PART_1_SCOPE = 50
+# Generated reboots: part 2 cuboids spread over +-GENERATE_RANGE for GENERATE_STEPS steps, with sides up to
+# GENERATE_SIDE. The range grows with the cube root of the number of steps, keeping the puzzle input's density
+GENERATE_STEPS = 400
+GENERATE_RANGE = 100000
+GENERATE_SIDE = 40000
+GENERATE_ON = 0.75
+# Mixed generated reboots: GENERATE_MIXED_SMALL of the steps are tiny cuboids within the part 1 scope, the rest
+# are large cuboids over it, so that cuboid sizes differ by thousands of times
+GENERATE_MIXED_SMALL = 0.75
+GENERATE_MIXED_SIDES = ((5, 10), (10000, 30000))
 
 
 def parse_line(line):
@@ -39,15 +56,23 @@ def calculate_size(cube):
     return (x_max - x_min) * (y_max - y_min) * (z_max - z_min)
 
 
+def in_scope(cube, limit_scope):
+    """ Return True if cube is entirely within +-limit_scope, or limit_scope is None """
+    if limit_scope is None:
+        return True
+    return min([c[0] for c in cube]) >= -limit_scope and max([c[1] for c in cube]) <= limit_scope
+
+
 def calculate_cubes(data, limit_scope=None):
-    """ Calcualate the number of cubes in data """
+    """ Calcualate the number of cubes in data
+        Signed engine: every overlap with an existing cube is recorded as a cancelling anti-cube
+    """
 
     # Record occurance of cubes: positive for cubes, negative is an anti-cube to cancel an overlapping cube
     cubes = defaultdict(int)
     for i, (state, cube) in enumerate(data):
-        if limit_scope is not None:
-            if min([c[0] for c in cube]) < -limit_scope or max([c[1] for c in cube]) > limit_scope:
-                continue
+        if not in_scope(cube, limit_scope):
+            continue
         # For overlaps between this cube and existing cubes, create a cube that is the inverse of the overlap
         cubes_updates = defaultdict(int)
         for cube_b, cube_b_val in cubes.items():
@@ -68,15 +93,238 @@ def calculate_cubes(data, limit_scope=None):
     return result
 
 
+def subtract(cube, hole):
+    """ Return cube minus hole as up to 6 disjoint cuboids. hole must be inside cube """
+    (x_min, x_max), (y_min, y_max), (z_min, z_max) = cube
+    (hx_min, hx_max), (hy_min, hy_max), (hz_min, hz_max) = hole
+    pieces = []
+    # Slabs either side of the hole in x, then the rest of the hole's x range either side in y, then in z
+    if x_min < hx_min:
+        pieces.append(((x_min, hx_min), (y_min, y_max), (z_min, z_max)))
+    if hx_max < x_max:
+        pieces.append(((hx_max, x_max), (y_min, y_max), (z_min, z_max)))
+    if y_min < hy_min:
+        pieces.append(((hx_min, hx_max), (y_min, hy_min), (z_min, z_max)))
+    if hy_max < y_max:
+        pieces.append(((hx_min, hx_max), (hy_max, y_max), (z_min, z_max)))
+    if z_min < hz_min:
+        pieces.append(((hx_min, hx_max), (hy_min, hy_max), (z_min, hz_min)))
+    if hz_max < z_max:
+        pieces.append(((hx_min, hx_max), (hy_min, hy_max), (hz_max, z_max)))
+    return pieces
+
+
+class CuboidIndex:
+    """ Set of disjoint cuboids, indexed by a hierarchy of grids of buckets so that overlaps with a cuboid are found
+        without scanning them all
+        Level k is a grid of cells of side 2**k. A cuboid is listed on the lowest level, from min_level, whose cells
+        are at least as large as its longest side, so it touches at most 8 buckets whatever its size. A query tests
+        the cuboids listed in the buckets it touches on each level, with one vectorised test over their bounds. Where
+        the query would touch more buckets of a level than there are cuboids on it, as a large query does on the
+        levels of small cuboids, all the cuboids of that level are tested instead. bounds holds one contiguous row per
+        bound (x_min, x_max, y_min, y_max, z_min, z_max). Removed cuboids are marked dead, and are compacted away,
+        with the buckets rebuilt, once they make up half of the arrays
+    """
+    def __init__(self, min_level=0, capacity=1024):
+        self.min_level = min_level
+        self.levels = defaultdict(lambda: defaultdict(list))
+        self.members = defaultdict(list)
+        self.bounds = np.zeros((6, capacity), dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.size = 0
+        self.dead = 0
+
+    def _level(self, cube):
+        """ Lowest level whose cells are at least as large as the longest side of cube """
+        return max(self.min_level, (max(max_ - min_ for min_, max_ in cube) - 1).bit_length())
+
+    @staticmethod
+    def _ranges(cube, level):
+        """ Ranges of cells of level that cube touches along each axis """
+        return [range(min_ >> level, ((max_ - 1) >> level) + 1) for min_, max_ in cube]
+
+    def _insert(self, index, cube):
+        level = self._level(cube)
+        self.members[level].append(index)
+        buckets = self.levels[level]
+        for key in itertools.product(*self._ranges(cube, level)):
+            buckets[key].append(index)
+
+    def add(self, cube):
+        if self.size == len(self.alive):
+            self._resize(2 * len(self.alive))
+        (x_min, x_max), (y_min, y_max), (z_min, z_max) = cube
+        self.bounds[:, self.size] = (x_min, x_max, y_min, y_max, z_min, z_max)
+        self.alive[self.size] = True
+        self._insert(self.size, cube)
+        self.size += 1
+
+    def remove(self, index):
+        self.alive[index] = False
+        self.dead += 1
+
+    def overlapping(self, cube):
+        """ Return the indices of live cuboids that overlap cube """
+        candidates = set()
+        for level, buckets in self.levels.items():
+            ranges = self._ranges(cube, level)
+            members = self.members[level]
+            if len(ranges[0]) * len(ranges[1]) * len(ranges[2]) > len(members):
+                candidates.update(members)
+                continue
+            for key in itertools.product(*ranges):
+                bucket = buckets.get(key)
+                if bucket:
+                    candidates.update(bucket)
+        if not candidates:
+            return []
+        indices = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        (x_min, x_max), (y_min, y_max), (z_min, z_max) = cube
+        bounds = self.bounds[:, indices]
+        mask = self.alive[indices] & (bounds[0] < x_max) & (bounds[1] > x_min)
+        mask &= (bounds[2] < y_max) & (bounds[3] > y_min)
+        mask &= (bounds[4] < z_max) & (bounds[5] > z_min)
+        return indices[mask].tolist()
+
+    def cuboid(self, index):
+        x_min, x_max, y_min, y_max, z_min, z_max = self.bounds[:, index].tolist()
+        return (x_min, x_max), (y_min, y_max), (z_min, z_max)
+
+    def compact(self):
+        """ Drop dead cuboids if they are at least half of the arrays """
+        if self.dead * 2 < self.size:
+            return
+        alive = np.flatnonzero(self.alive[:self.size])
+        self.size = len(alive)
+        self.bounds[:, :self.size] = self.bounds[:, alive]
+        self.alive[:self.size] = True
+        self.alive[self.size:] = False
+        self.dead = 0
+        # Indices have changed, so rebuild the buckets
+        self.levels = defaultdict(lambda: defaultdict(list))
+        self.members = defaultdict(list)
+        for index in range(self.size):
+            self._insert(index, self.cuboid(index))
+
+    def _resize(self, capacity):
+        bounds = np.zeros((6, capacity), dtype=np.int64)
+        bounds[:, :self.size] = self.bounds[:, :self.size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.size] = self.alive[:self.size]
+        self.bounds = bounds
+        self.alive = alive
+
+    def volume(self):
+        alive = self.alive[:self.size]
+        bounds = self.bounds[:, :self.size][:, alive]
+        sides = zip((bounds[1] - bounds[0]).tolist(), (bounds[3] - bounds[2]).tolist(), (bounds[5] - bounds[4]).tolist())
+        # Python ints: the total can exceed int64
+        return sum(x * y * z for x, y, z in sides)
+
+    def __len__(self):
+        return self.size - self.dead
+
+
+def calculate_cubes_disjoint(data, limit_scope=None):
+    """ Calculate the number of cubes in data
+        Disjoint engine: lit cubes are kept as disjoint cuboids. Each step cuts itself out of the cuboids it overlaps,
+        which are found through grids of buckets sized to the cuboids (CuboidIndex), then is added if it is "on"
+    """
+    steps = [(state, cube) for state, cube in data if in_scope(cube, limit_scope)]
+    # No cells smaller than a typical step: the pieces cut from steps would spread over many small levels, and a
+    # step would have to look them all up
+    sides = sorted(max_ - min_ for _, cube in steps for min_, max_ in cube)
+    cubes = CuboidIndex((sides[len(sides) // 2] - 1).bit_length() if sides else 0)
+    for state, cube in steps:
+        for index in cubes.overlapping(cube):
+            cube_b = cubes.cuboid(index)
+            cubes.remove(index)
+            for piece in subtract(cube_b, calculate_overlap(cube, cube_b)):
+                cubes.add(piece)
+        if state:
+            cubes.add(cube)
+        cubes.compact()
+    log.debug(f"{len(cubes)} disjoint cuboids")
+    return cubes.volume()
+
+
+ENGINES = {
+    "signed": calculate_cubes,
+    "disjoint": calculate_cubes_disjoint,
+}
+
+
+def generate_steps(count, seed=0):
+    """ Generate count reboot steps like the puzzle input: 20 small steps within the part 1 scope, then large
+        cuboids spread out so that they overlap about as often as in the input
+    """
+    rng = np.random.default_rng(seed)
+    small = min(count, 20)
+    scale = max(1.0, (count - small) / GENERATE_STEPS) ** (1 / 3)
+    steps = []
+    for i in range(count):
+        if i < small:
+            limit, side = PART_1_SCOPE, PART_1_SCOPE
+        else:
+            limit, side = int(GENERATE_RANGE * scale), GENERATE_SIDE
+        lo = rng.integers(-limit, limit - side // 4, 3)
+        hi = np.minimum(lo + rng.integers(side // 4, side, 3), limit)
+        state = bool(i == 0 or rng.random() < GENERATE_ON)
+        steps.append((state, tuple(zip(lo.tolist(), (hi + 1).tolist()))))
+    return steps
+
+
+def generate_mixed_steps(count, seed=0):
+    """ Generate count reboot steps of very different sizes around the origin: mostly tiny cuboids with sides in the
+        first of GENERATE_MIXED_SIDES, and large ones with sides in the second
+    """
+    rng = np.random.default_rng(seed)
+    steps = []
+    for i in range(count):
+        small = i > 0 and rng.random() < GENERATE_MIXED_SMALL
+        side_min, side_max = GENERATE_MIXED_SIDES[0 if small else 1]
+        sides = rng.integers(side_min, side_max + 1, 3)
+        lo = rng.integers(-PART_1_SCOPE, PART_1_SCOPE + 1, 3) - (0 if small else sides // 2)
+        state = bool(i == 0 or rng.random() < GENERATE_ON)
+        steps.append((state, tuple(zip(lo.tolist(), (lo + sides).tolist()))))
+    return steps
+
+
+def add_args(parser):
+    parser.add_argument('-e', '--engine', choices=ENGINES.keys(), default="disjoint", help="Reboot engine")
+    parser.add_argument('-b', '--benchmark', action='store_true', help="Compare engines, checking they agree")
+    parser.add_argument('--generate', type=int, default=None, help="Use n generated steps instead of input")
+    parser.add_argument('--mixed', action='store_true',
+                        help="With --generate, mix tiny and large cuboids instead of steps like the input")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for --generate")
+
+
 def main():
-    args = parse_args()
-    lines = read_lines(args.input)
-    data = [parse_line(line) for line in lines]
+    args = parse_args(add_args)
+    if args.generate is not None:
+        data = (generate_mixed_steps if args.mixed else generate_steps)(args.generate, args.seed)
+        log.always(f"Generated {len(data)} steps")
+    else:
+        lines = read_lines(args.input)
+        data = [parse_line(line) for line in lines]
+
+    if args.benchmark:
+        for title, limit_scope in [("Part 1", PART_1_SCOPE), ("Part 2", None)]:
+            rows = []
+            results = {}
+            for name, func in ENGINES.items():
+                results[name], seconds, _ = benchmark(func, data, limit_scope)
+                rows.append((name, seconds, None))
+            log_benchmarks(title, rows)
+            if len(set(results.values())) != 1:
+                log.error(f"{title}: engines disagree: {results}")
+        return
 
+    calculate = ENGINES[args.engine]
     log.always("Part 1:")
-    log.always(calculate_cubes(data, 50))
+    log.always(calculate(data, PART_1_SCOPE))
     log.always("Part 2:")
-    log.always(calculate_cubes(data))
+    log.always(calculate(data))
 
 
 if __name__ == "__main__":
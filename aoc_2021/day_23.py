@@ -4,6 +4,8 @@ import sys
 import traceback
 
 from common.utils import *
+from common.benchmark import *
+from common.search import *
 
 
 AMPHIPODS = ["A", "B", "C", "D"]
@@ -15,6 +17,12 @@ COSTS = {
     "D": 1000,
 }
 
+HALLWAY_LENGTH = 11
+# Hallway x of the door of each room, in AMPHIPODS order
+DOORS = [2, 4, 6, 8]
+# Hallway x where amphipods may stop: anywhere but outside a door
+STOPS = [x for x in range(HALLWAY_LENGTH) if x not in DOORS]
+
 
 def state_to_str(state):
     """ Convert state to string """
@@ -97,8 +105,135 @@ def generate_moves(cost, state_str):
     return result
 
 
-def solve(input_text):
-    state_str = state_to_str([input_text[1][1:-1]] + ["#" + line.strip().replace("###", "#") + "#" for line in input_text[2:-1]])
+class Burrow:
+    """ Move tables for a burrow with rooms depth deep, over packed states
+        A packed state is bytes: the hallway, then each room from the top down, where 0 is empty and 1-4 are the
+        amphipods A-D. Which hallway cells each move passes through, and how far it is, is computed once
+    """
+    def __init__(self, depth):
+        self.depth = depth
+        self.rooms = [[HALLWAY_LENGTH + room * depth + slot for slot in range(depth)] for room in range(len(DOORS))]
+        self.goal = bytes([0] * HALLWAY_LENGTH + [room + 1 for room in range(len(DOORS)) for _ in range(depth)])
+        # paths[stop][room]: (hallway cells between stop and the door of room, excluding stop, hallway distance)
+        self.paths = {
+            stop: [
+                (tuple(x for x in range(min(stop, door), max(stop, door) + 1) if x != stop), abs(stop - door))
+                for door in DOORS
+            ]
+            for stop in STOPS
+        }
+        self.costs = [0] + [COSTS[amphipod] for amphipod in AMPHIPODS]
+
+    def pack(self, state_str):
+        """ Pack a state string into bytes """
+        state = state_from_str(state_str)
+        codes = {".": 0, **{amphipod: i + 1 for i, amphipod in enumerate(AMPHIPODS)}}
+        hallway = [codes[c] for c in state[0]]
+        rooms = [codes[state[slot + 1][door]] for door in DOORS for slot in range(self.depth)]
+        return bytes(hallway + rooms)
+
+    def settled(self, state, room):
+        """ Return the first slot from which room holds only its own amphipods down to the bottom """
+        cells = self.rooms[room]
+        slot = self.depth
+        while slot and state[cells[slot - 1]] == room + 1:
+            slot -= 1
+        return slot
+
+    def neighbours(self, state):
+        """ Return [(next state, cost)] for every move from state
+            If an amphipod can move into its room that is the only move returned: doing it first is never worse
+        """
+        for stop in STOPS:
+            amphipod = state[stop]
+            if not amphipod:
+                continue
+            room = amphipod - 1
+            cells = self.rooms[room]
+            # The room must hold nothing but its own amphipods
+            slot = self.settled(state, room)
+            if any(state[cells[i]] for i in range(slot)):
+                continue
+            path, distance = self.paths[stop][room]
+            if any(state[x] for x in path):
+                continue
+            _state = bytearray(state)
+            _state[stop] = 0
+            _state[cells[slot - 1]] = amphipod
+            return [(bytes(_state), (distance + slot) * self.costs[amphipod])]
+
+        result = []
+        for room, cells in enumerate(self.rooms):
+            settled = self.settled(state, room)
+            # Top amphipod above the settled part of the room
+            slot = 0
+            while slot < settled and not state[cells[slot]]:
+                slot += 1
+            if slot == settled:
+                continue
+            amphipod = state[cells[slot]]
+            for stop in STOPS:
+                path, distance = self.paths[stop][room]
+                if state[stop] or any(state[x] for x in path):
+                    continue
+                _state = bytearray(state)
+                _state[cells[slot]] = 0
+                _state[stop] = amphipod
+                result.append((bytes(_state), (distance + slot + 1) * self.costs[amphipod]))
+        return result
+
+    def heuristic(self, state):
+        """ Lower bound on the cost to finish from state, which never drops by more than the cost of a move
+            Each amphipod out of place pays for the steps up out of its room and along the hallway to its door, or 2
+            to step aside if it must leave its own room. Each room then pays for the steps down to fill its
+            unsettled slots
+        """
+        total = 0
+        for stop in STOPS:
+            amphipod = state[stop]
+            if amphipod:
+                total += abs(stop - DOORS[amphipod - 1]) * self.costs[amphipod]
+        for room, cells in enumerate(self.rooms):
+            settled = self.settled(state, room)
+            for slot in range(settled):
+                amphipod = state[cells[slot]]
+                if amphipod:
+                    sideways = abs(DOORS[room] - DOORS[amphipod - 1]) or 2
+                    total += (slot + 1 + sideways) * self.costs[amphipod]
+            # Unsettled slots are filled by amphipods walking down from the door, 1 + 2 + ... + settled steps
+            total += settled * (settled + 1) // 2 * self.costs[room + 1]
+        return total
+
+
+def parse_state(input_text):
+    """ Return the state string of the burrow drawn in input_text """
+    return state_to_str([input_text[1][1:-1]] + ["#" + line.strip().replace("###", "#") + "#" for line in input_text[2:-1]])
+
+
+def solve(input_text, stats=None):
+    """ Return the least energy to organise the amphipods. A* over packed states with Burrow move tables
+        If stats is a dict, the number of states expanded is stored in stats["expanded"]
+    """
+    state_str = parse_state(input_text)
+    burrow = Burrow(len(state_from_str(state_str)) - 1)
+    expanded = 0
+
+    def neighbours(state):
+        nonlocal expanded
+        expanded += 1
+        return burrow.neighbours(state)
+
+    cost, _ = astar([burrow.pack(state_str)], neighbours, burrow.goal.__eq__, burrow.heuristic)
+    if stats is not None:
+        stats["expanded"] = expanded
+    return cost
+
+
+def solve_strings(input_text, stats=None):
+    """ Return the least energy to organise the amphipods. Dijkstra over state strings
+        If stats is a dict, the number of states expanded is stored in stats["expanded"]
+    """
+    state_str = parse_state(input_text)
     desired_state_str = generate_desired_state(state_str)
     steps = HeapQ([(0, state_str)])
     seen = set()
@@ -113,19 +248,38 @@ def solve(input_text):
         seen.add(state_str)
         for _cost, _state_str in generate_moves(cost, state_str):
             steps.push((_cost, _state_str))
+    if stats is not None:
+        stats["expanded"] = len(seen)
     return result
 
 
+def add_args(parser):
+    parser.add_argument('-b', '--benchmark', action='store_true',
+                        help="Compare with the string state search: time, states expanded and peak memory")
+
+
 def main():
-    args = parse_args()
+    args = parse_args(add_args)
     data = read_lines(args.input, to_list=True)
+    data_2 = data[:3] + ["  #D#C#B#A#", "  #D#B#A#C#"] + data[3:]
+
+    if args.benchmark:
+        for title, _data in [("Part 1", data), ("Part 2", data_2)]:
+            rows = []
+            for name, func in [("strings, Dijkstra", solve_strings), ("packed, A*", solve)]:
+                stats = {}
+                result, seconds, _ = benchmark(func, _data, stats)
+                _, _, peak = benchmark(func, _data, trace_memory=True)
+                rows.append((name, seconds, peak))
+                log.always(f"  {name:<24} {result}, {stats['expanded']} states expanded")
+            log_benchmarks(title, rows)
+        return
 
     log.always("Part 1:")
     log.always(solve(data))
 
     log.always("Part 2:")
-    data = data[:3] + ["  #D#C#B#A#", "  #D#B#A#C#"] + data[3:]
-    log.always(solve(data))
+    log.always(solve(data_2))
 
 
 if __name__ == "__main__":
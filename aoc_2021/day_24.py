@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 
+import functools
+import math
 import sys
 import traceback
 
 from common.utils import *
+from common.benchmark import *
 
 """
 The ALU code appear to be in blocks of 18 instructions which is repeated 14 times. 
@@ -40,6 +43,8 @@ Z will grow unless ZZ is 26 in which case it _can_ decrease, but only if ((z % 2
 
 
 BLOCK_SIZE = 18
+# Most (block index, z) results kept by solve_extremes
+CACHE_SIZE = 1 << 20
 
 
 def eval_block(block, digit, z):
@@ -87,8 +92,117 @@ def solve(block_values, i=0, z=0, largest=True):
     return 0
 
 
+def z_limits(block_values):
+    """ Return limits, where z before block i can only reach 0 at the end if z < limits[i]
+        Think of z as a stack of base 26 digits. A block that divides by 26 removes at most one digit. A block that
+        divides by 1 and can never match a digit (xx outside -25..9) always pushes one non-zero digit. So z can have
+        at most as many digits as there are dividing blocks left, less pushing blocks left. If blocks do not fit that
+        pattern, fall back to z shrinking by at most a factor of zz per block
+    """
+    n = len(block_values)
+    if any(zz not in (1, 26) or yy < 0 for zz, _, yy in block_values):
+        if any(yy < -1 for _, _, yy in block_values):
+            # z can shrink without dividing, so there is no bound
+            return [math.inf] * (n + 1)
+        return [math.prod(zz for zz, _, _ in block_values[i:]) for i in range(n + 1)]
+    limits = []
+    for i in range(n + 1):
+        pops = sum(1 for zz, _, _ in block_values[i:] if zz == 26)
+        pushes = sum(1 for zz, xx, _ in block_values[i:] if zz == 1 and not -25 <= xx <= 9)
+        limits.append(26 ** (pops - pushes) if pops >= pushes else 0)
+    return limits
+
+
+def solve_extremes(block_values, cache_size=CACHE_SIZE):
+    """ Return (smallest, largest) model numbers that leave z=0, or (None, None), in a single traversal
+        Every digit is tried in every block, without assuming that decrease blocks must match. Instead:
+        * z at or above z_limits() can never get back to 0 and is dead
+        * results for (block index, z), including dead ones, are memoised in a cache of up to cache_size entries,
+          shared by the scans for the smallest and largest digits
+    """
+    n = len(block_values)
+    limits = z_limits(block_values)
+
+    @functools.lru_cache(maxsize=cache_size)
+    def extremes(i, z):
+        """ Return (smallest, largest) digits for blocks i onwards that take z to 0, or None """
+        if i == n:
+            return (0, 0) if z == 0 else None
+        zz, xx, yy = block_values[i]
+        limit = limits[i + 1]
+        # eval_block() for every digit, keeping the ones that stay within the limit
+        match = (z % 26) + xx
+        _z = z // zz
+        children = [(digit, _z if digit == match else _z * 26 + digit + yy) for digit in range(1, 10)]
+        children = [(digit, _z) for digit, _z in children if _z < limit]
+        # The smallest number starts with the lowest digit that leads anywhere, and the largest with the highest.
+        # Scan up for the first, then down for the second, which must stop by the first
+        place = 10 ** (n - 1 - i)
+        for low, (digit, _z) in enumerate(children):
+            result = extremes(i + 1, _z)
+            if result is not None:
+                smallest = digit * place + result[0]
+                break
+        else:
+            return None
+        for digit, _z in reversed(children[low:]):
+            result = extremes(i + 1, _z)
+            if result is not None:
+                return smallest, digit * place + result[1]
+
+    result = extremes(0, 0) if limits[0] > 0 else None
+    log.info(f"Cache: {extremes.cache_info()}")
+    return result if result is not None else (None, None)
+
+
+def run_alu(instructions, digits):
+    """ Execute ALU instructions, reading input from digits. Return the registers """
+    registers = {"w": 0, "x": 0, "y": 0, "z": 0}
+    digits = iter(digits)
+
+    def value(operand):
+        return registers[operand] if operand in registers else int(operand)
+
+    for op, *operands in instructions:
+        a = operands[0]
+        if op == "inp":
+            registers[a] = next(digits)
+            continue
+        b = value(operands[1])
+        if op == "add":
+            registers[a] += b
+        elif op == "mul":
+            registers[a] *= b
+        elif op == "div":
+            # ALU division truncates towards zero
+            quotient = abs(registers[a]) // abs(b)
+            registers[a] = quotient if (registers[a] < 0) == (b < 0) else -quotient
+        elif op == "mod":
+            registers[a] %= b
+        elif op == "eql":
+            registers[a] = int(registers[a] == b)
+        else:
+            raise ValueError(f"Unknown instruction: {op}")
+    return registers
+
+
+def verify(instructions, model_number):
+    """ Return True if running the original instructions on model_number leaves z=0 """
+    digits = [int(c) for c in str(model_number)]
+    return 0 not in digits and run_alu(instructions, digits)["z"] == 0
+
+
+def solve_twice(block_values):
+    """ Return (smallest, largest) with two depth first searches """
+    return solve(block_values, largest=False), solve(block_values, largest=True)
+
+
+def add_args(parser):
+    parser.add_argument('-b', '--benchmark', action='store_true', help="Compare with two depth first searches")
+
+
 def main():
-    args = parse_args()
+    args = parse_args(add_args)
     data_raw = read_lines(args.input)
 
     instructions = [line.split(" ") for line in data_raw]
@@ -98,13 +212,25 @@ def main():
         for i in range(0, len(instructions), BLOCK_SIZE)
     ]
 
+    if args.benchmark:
+        rows = []
+        for name, func in [("two searches", solve_twice), ("one memoised pass", solve_extremes)]:
+            result, seconds, _ = benchmark(func, block_values)
+            rows.append((name, seconds, None))
+            log.always(f"  {name:<24} {result}")
+        log_benchmarks("Both parts", rows)
+        return
+
+    smallest, largest = solve_extremes(block_values)
+    for result in (largest, smallest):
+        if result is None or not verify(instructions, result):
+            log.error(f"{result} does not pass the ALU")
+
     log.always("Part 1:")
-    result = solve(block_values, largest=True)
-    log.always(result)
+    log.always(largest)
 
     log.always("Part 2:")
-    result = solve(block_values, largest=False)
-    log.always(result)
+    log.always(smallest)
 
 
 if __name__ == "__main__":
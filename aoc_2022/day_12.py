@@ -2,10 +2,40 @@
 
 import sys
 import traceback
+
+import numpy as np
+
 from common.utils import *
+from common.benchmark import *
+from common.search import *
+
+
+# Border height for the flat grid: too high to ever climb onto
+BORDER_HEIGHT = 100
 
 
 def solve(data, starts, end):
+    """ Find the shortest path between starts and end of data, ascending at most 1 each time
+        A* over flat indices with a bucket queue and a Manhattan distance heuristic
+    """
+    grid = FlatGrid(np.array(data), fill=BORDER_HEIGHT)
+    cells = grid.cells
+    offsets = grid.offsets
+    _end = grid.index(end[1], end[0])
+
+    def neighbours(index):
+        limit = cells[index] + 1
+        return [(_index, 1) for _index in [index + offset for offset in offsets] if cells[_index] <= limit]
+
+    def is_goal(index):
+        return index == _end
+
+    _starts = [grid.index(y, x) for x, y in starts]
+    cost, _ = astar(_starts, neighbours, is_goal, manhattan_heuristic(grid, _end), bucket_queue=True)
+    return cost
+
+
+def solve_heapq(data, starts, end):
     """ Find the shortest path between starts and end of data, ascending at most 1 each time """
     # Use Dijkstra search
     explored = set()
@@ -27,8 +57,12 @@ def solve(data, starts, end):
     return None
 
 
+def add_args(parser):
+    parser.add_argument('-b', '--benchmark', action='store_true', help="Compare the A* search with the old Dijkstra")
+
+
 def main():
-    args = parse_args()
+    args = parse_args(add_args)
     data = read_lines(args.input, to_list=True)
 
     # Find start and end coordinates in data
@@ -57,6 +91,14 @@ def main():
     result = solve(data, starts, end)
     log.always(result)
 
+    if args.benchmark:
+        for title, _starts in [("Part 1", [start]), ("Part 2", starts)]:
+            rows = []
+            for name, func in [("heapq tuples", solve_heapq), ("common.search", solve)]:
+                _, seconds, _ = benchmark(func, data, _starts, end)
+                rows.append((name, seconds, None))
+            log_benchmarks(title, rows)
+
 
 if __name__ == "__main__":
     # noinspection PyBroadException
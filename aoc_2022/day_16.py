@@ -4,7 +4,15 @@ import functools
 import re
 import sys
 import traceback
+
+import numpy as np
+
 from common.utils import *
+from common.benchmark import *
+
+
+# Distance between valves with no path between them: above any time budget
+UNREACHABLE = np.iinfo(np.int64).max // 4
 
 
 def parse_input(input_path):
@@ -35,7 +43,11 @@ def calculate_path_len(connections, start, end):
     return None
 
 
-def solve(flow_rates, paths, t_max=30, do_part_2=False):
+def solve_memoised(flow_rates, paths, t_max=30, do_part_2=False, stats=None):
+    """ Search over (position, time, opened valves), memoised. For part 2 the elephant's search restarts from every
+        state of the human's
+        If stats is a dict, the number of cached states is stored in stats["states"]
+    """
     @functools.lru_cache(maxsize=None)
     def _solve(position, t, opened, move_elephant=False):
         if t > 15 and not move_elephant:
@@ -59,27 +71,134 @@ def solve(flow_rates, paths, t_max=30, do_part_2=False):
             _result = _solve("AA", t_max, opened, move_elephant=True)
             result = max(result, _result)
         return result
-    return _solve("AA", t_max, tuple())
+    result = _solve("AA", t_max, tuple())
+    if stats is not None:
+        stats["states"] = _solve.cache_info().currsize
+    return result
 
 
-def main():
-    args = parse_args()
-    flow_rates, connections = parse_input(args.input)
+def distance_matrix(connections):
+    """ Return (valves, distances): every valve, and an array of the shortest path lengths between each pair of them,
+        by Floyd-Warshall
+    """
+    valves = sorted(connections)
+    index = {valve: i for i, valve in enumerate(valves)}
+    # Unreachable pairs keep a distance of UNREACHABLE, low enough that adding two of them can not overflow
+    distances = np.full((len(valves), len(valves)), UNREACHABLE, dtype=np.int64)
+    np.fill_diagonal(distances, 0)
+    for valve, tunnels in connections.items():
+        for tunnel in tunnels:
+            distances[index[valve], index[tunnel]] = 1
+    for k in range(len(valves)):
+        np.minimum(distances, distances[:, k, None] + distances[None, k, :], out=distances)
+    return valves, distances
+
+
+def best_pressures(flow_rates, connections, t_max, stats=None):
+    """ Return best, where best[mask] is the most pressure released in t_max minutes from AA by opening exactly the
+        valves in bitmask mask, or -1 if they can not all be opened in time. Bit i is the i-th valve with a non-zero
+        flow rate, in sorted order. Every order of opening valves is followed once, moving straight between valves
+        If stats is a dict, the number of states visited is stored in stats["states"]
+    """
+    valves, distances = distance_matrix(connections)
+    flow_valves = sorted(flow_rates)
+    rates = [flow_rates[valve] for valve in flow_valves]
+    indices = [valves.index(valve) for valve in flow_valves]
+    # (valve, minutes to move to it and open it) from each flow valve, or from AA (last), to each reachable flow valve
+    costs = [[(valve, int(distances[a, b]) + 1) for valve, b in enumerate(indices) if distances[a, b] < UNREACHABLE]
+             for a in indices + [valves.index("AA")]]
+    bits = [1 << i for i in range(len(flow_valves))]
+
+    best = [-1] * (1 << len(flow_valves))
+    stack = [(len(flow_valves), t_max, 0, 0)]
+    visited = 0
+    while stack:
+        position, t, mask, pressure = stack.pop()
+        visited += 1
+        if pressure > best[mask]:
+            best[mask] = pressure
+        for valve, cost in costs[position]:
+            _t = t - cost
+            if _t > 0 and not mask & bits[valve]:
+                stack.append((valve, _t, mask | bits[valve], pressure + rates[valve] * _t))
+    if stats is not None:
+        stats["states"] = visited
+    return best
+
+
+def best_disjoint_pair(best):
+    """ Return the most pressure released by two actors opening disjoint sets of valves, from best_pressures() """
+    n_bits = len(best).bit_length() - 1
+    # Most pressure for any subset of each mask: one actor can always open fewer valves
+    subsets = list(best)
+    for bit in range(n_bits):
+        bit = 1 << bit
+        for mask in range(len(subsets)):
+            if mask & bit and subsets[mask ^ bit] > subsets[mask]:
+                subsets[mask] = subsets[mask ^ bit]
+    full = len(subsets) - 1
+    return max(subsets[mask] + subsets[full ^ mask] for mask in range(len(subsets)))
+
 
-    # Calculate paths between all nodes with non-zero flow rate
+def solve(flow_rates, connections, t_max=30, do_part_2=False, stats=None):
+    """ Bitmask engine: the best pressure for every set of opened valves in one search, and for part 2 the best pair
+        of disjoint sets
+    """
+    best = best_pressures(flow_rates, connections, t_max, stats)
+    if do_part_2:
+        return best_disjoint_pair(best)
+    return max(best)
+
+
+def calculate_paths(flow_rates, connections):
+    """ Calculate paths between all nodes with non-zero flow rate, for solve_memoised() """
     paths = {}
     for start in ["AA", *flow_rates.keys()]:
         paths[start] = {}
         for end in flow_rates.keys():
             if end != start:
                 paths[start][end] = calculate_path_len(connections, start, end)
+    return paths
+
+
+def run_benchmarks(flow_rates, connections):
+    """ Compare the engines on both parts, with the number of states each caches or visits """
+    for title, t_max, do_part_2 in [("Part 1", 30, False), ("Part 2", 26, True)]:
+        rows = []
+        results = set()
+        # Finding path lengths is timed as part of each engine
+        for name, func, graph in [
+            ("memoised", solve_memoised, lambda: calculate_paths(flow_rates, connections)),
+            ("bitmask", solve, lambda: connections),
+        ]:
+            stats = {}
+            result, seconds, _ = benchmark(lambda: func(flow_rates, graph(), t_max, do_part_2, stats))
+            rows.append((name, seconds, None))
+            results.add(result)
+            log.always(f"  {name:<24} {result}, {stats['states']} states")
+        log_benchmarks(title, rows)
+        if len(results) != 1:
+            log.error(f"{title}: engines disagree: {results}")
+
+
+def add_args(parser):
+    parser.add_argument('-b', '--benchmark', action='store_true', help="Compare the bitmask and memoised engines")
+
+
+def main():
+    args = parse_args(add_args)
+    flow_rates, connections = parse_input(args.input)
+
+    if args.benchmark:
+        run_benchmarks(flow_rates, connections)
+        return
 
     log.always("Part 1:")
-    result = solve(flow_rates, paths, t_max=30)
+    result = solve(flow_rates, connections, t_max=30)
     log.always(result)
 
     log.always("Part 2:")
-    result = solve(flow_rates, paths, t_max=26, do_part_2=True)
+    result = solve(flow_rates, connections, t_max=26, do_part_2=True)
     log.always(result)
 
 
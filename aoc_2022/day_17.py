@@ -1,9 +1,23 @@
 #!/usr/bin/env python3
 
 import sys
+import time
 import traceback
 import numpy as np
 from common.utils import *
+from common.benchmark import *
+
+
+N_ROCKS_1 = 2022
+N_ROCKS_2 = 1000000000000
+# Rows kept below the top of the tower by the bit row engine. Rocks must never fall further than this
+DEPTH = 1024
+# Rows from the top of the tower that identify a repeated state
+PROFILE_ROWS = 32
+# Rocks dropped by the benchmark without skipping cycles
+BENCHMARK_ROCKS = [10000, 100000, 1000000]
+# Memory is traced for benchmarks of up to this many rocks, as tracing makes them ~25x slower
+BENCHMARK_TRACE_ROCKS = 100000
 
 
 def parse_input(input_path):
@@ -34,9 +48,10 @@ def is_collision(world, rock, x, y):
     return np.any(world[y: y + rock.shape[0], x:x + rock.shape[1]] * rock)
 
 
-def solve(winds):
-    n_rounds_1 = 2022
-    n_rounds_2 = 1000000000000
+def solve_numpy(winds):
+    """ NumPy engine: the chamber is a bool array, and rocks are bool arrays """
+    n_rounds_1 = N_ROCKS_1
+    n_rounds_2 = N_ROCKS_2
     world = np.zeros([1024, 7], dtype=bool)
     # Set floor
     height = 0
@@ -93,17 +108,191 @@ def solve(winds):
         i += 1
 
 
+###############################################################################
+# Bit row engine: every row of the chamber is a 7-bit int, column 0 in bit 6
+
+
+def rock_bits(rock):
+    """ Pack rock, spawned 2 columns from the left wall, into an int with one byte per row, the bottom row lowest """
+    result = 0
+    for y, row in enumerate(rock):
+        for x, cell in enumerate(row):
+            if cell:
+                result |= 1 << (8 * y + 4 - x)
+    return result
+
+
+ROCK_BITS = [rock_bits(rock) for rock in ROCKS]
+# A rock touching the left or right wall has a bit in one of these
+LEFT_WALL = 0x40404040
+RIGHT_WALL = 0x01010101
+
+
+class Chamber:
+    """ The top DEPTH rows of the tower, as a rolling window of bytes, one per row
+        Rows that fall out of the bottom of the window are discarded, so memory is the same however many rocks are
+        dropped. Rocks are ints with a byte per row, so pushing one is a shift, and a collision is a nonzero AND
+        with the window rows it covers
+    """
+    def __init__(self, winds, depth=DEPTH):
+        self.winds = winds
+        self.depth = depth
+        # Room above the top of the tower for a new rock, which spawns 3 rows up and is at most 4 rows tall
+        self.rows = bytearray(2 * depth + 8)
+        # Absolute row of rows[0]
+        self.base = 0
+        self.height = 0
+        self.rock_i = 0
+        self.wind_i = 0
+
+    def drop(self):
+        """ Drop the next rock until it comes to rest """
+        rows = self.rows
+        winds = self.winds
+        n_winds = len(winds)
+        wind_i = self.wind_i
+        rock = ROCK_BITS[self.rock_i]
+        top = self.height - self.base
+
+        # The first 4 pushes all happen above the tower, so only the walls can stop them
+        for _ in range(4):
+            if winds[wind_i] < 0:
+                if not rock & LEFT_WALL:
+                    rock <<= 1
+            elif not rock & RIGHT_WALL:
+                rock >>= 1
+            wind_i += 1
+            if wind_i == n_winds:
+                wind_i = 0
+
+        y = top
+        while True:
+            # Fall
+            if y == 0:
+                if self.base:
+                    raise RuntimeError(f"Rock fell more than {self.depth} rows, increase the depth")
+                break
+            if int.from_bytes(rows[y - 1:y + 3], "little") & rock:
+                break
+            y -= 1
+            # Push
+            window = int.from_bytes(rows[y:y + 4], "little")
+            if winds[wind_i] < 0:
+                if not rock & LEFT_WALL and not (rock << 1) & window:
+                    rock <<= 1
+            elif not rock & RIGHT_WALL and not (rock >> 1) & window:
+                rock >>= 1
+            wind_i += 1
+            if wind_i == n_winds:
+                wind_i = 0
+
+        # Come to rest
+        rows[y:y + 4] = (int.from_bytes(rows[y:y + 4], "little") | rock).to_bytes(4, "little")
+        top = max(top, y + (rock.bit_length() + 7) // 8)
+        if top > 2 * self.depth:
+            # Roll the window: discard the lowest rows
+            del rows[:self.depth]
+            rows.extend(bytes(self.depth))
+            self.base += self.depth
+            top -= self.depth
+        self.height = top + self.base
+        self.wind_i = wind_i
+        self.rock_i = (self.rock_i + 1) % len(ROCK_BITS)
+
+    def state(self):
+        """ Return (rock index, wind index, top PROFILE_ROWS rows packed into an int), which determines the future """
+        top = self.height - self.base
+        return self.rock_i, self.wind_i, int.from_bytes(self.rows[max(0, top - PROFILE_ROWS):top], "little")
+
+
+def simulate(winds, n_rocks, depth=DEPTH):
+    """ Return the height of the tower after dropping n_rocks, one at a time """
+    chamber = Chamber(winds, depth)
+    for _ in range(n_rocks):
+        chamber.drop()
+    return chamber.height
+
+
+def solve(winds, rock_counts=(N_ROCKS_1, N_ROCKS_2), depth=DEPTH):
+    """ Return the height of the tower after each of rock_counts rocks
+        Rocks are dropped until a state repeats, then the cycle between the two is repeated arithmetically
+    """
+    chamber = Chamber(winds, depth)
+    # Height after each number of rocks, and the number of rocks at which each state was first seen
+    heights = [0]
+    seen = {}
+    while True:
+        state = chamber.state()
+        if state in seen:
+            break
+        seen[state] = len(heights) - 1
+        chamber.drop()
+        heights.append(chamber.height)
+
+    start = seen[state]
+    period = len(heights) - 1 - start
+    growth = heights[-1] - heights[start]
+    log.info(f"Cycle of {period} rocks and {growth} rows from rock {start}")
+    results = []
+    for n_rocks in rock_counts:
+        if n_rocks < len(heights):
+            results.append(heights[n_rocks])
+        else:
+            n_reps, n_rest = divmod(n_rocks - start, period)
+            results.append(heights[start + n_rest] + n_reps * growth)
+    return results
+
+
+def run_benchmarks(winds):
+    """ Compare the engines on both parts, then drop many rocks without skipping cycles """
+    rows = []
+    results = set()
+    for name, func in [("numpy", solve_numpy), ("bit rows", solve)]:
+        result, seconds, _ = benchmark(func, winds)
+        rows.append((name, seconds, None))
+        results.add(tuple(result))
+    log_benchmarks("Both parts, skipping cycles", rows)
+    if len(results) != 1:
+        log.error(f"Engines disagree: {results}")
+
+    for n_rocks in BENCHMARK_ROCKS:
+        height, seconds, _ = benchmark(simulate, winds, n_rocks)
+        # Memory is traced in a separate run, as tracing slows it down
+        peak = None
+        if n_rocks <= BENCHMARK_TRACE_ROCKS:
+            _, _, peak = benchmark(simulate, winds, n_rocks, trace_memory=True)
+        log_benchmarks(f"{n_rocks} rocks without skipping cycles: height {height}, "
+                       f"{n_rocks / seconds / 1000:.0f}k rocks/s", [("bit rows", seconds, peak)])
+
+
+def add_args(parser):
+    parser.add_argument('-n', '--rocks', type=int, default=None,
+                        help="Also report the height after this many rocks, dropping every rock")
+    parser.add_argument('--depth', type=int, default=DEPTH, help="Rows kept below the top of the tower")
+    parser.add_argument('-b', '--benchmark', action='store_true', help="Compare the bit row and NumPy engines")
+
+
 def main():
-    args = parse_args()
+    args = parse_args(add_args)
     data = parse_input(args.input)
 
-    result_1, result_2 = solve(data)
+    if args.benchmark:
+        run_benchmarks(data)
+        return
+
+    result_1, result_2 = solve(data, depth=args.depth)
     log.always("Part 1:")
     log.always(result_1)
 
     log.always("Part 2:")
     log.always(result_2)
 
+    if args.rocks is not None:
+        log.always(f"After {args.rocks} rocks:")
+        start = time.perf_counter()
+        log.always(simulate(data, args.rocks, args.depth))
+        log.info(f"{time.perf_counter() - start:.2f} s")
+
 
 if __name__ == "__main__":
     # noinspection PyBroadException
@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 
+import os
 import re
 import sys
 import traceback
+from concurrent.futures import ProcessPoolExecutor
+
 from common.utils import *
+from common.benchmark import *
 
 
 RE_LINE = r"Blueprint (\d+): Each ore robot costs (\d+) ore. Each clay robot costs (\d+) ore. Each obsidian robot costs (\d+) ore and (\d+) clay. Each geode robot costs (\d+) ore and (\d+) obsidian."
@@ -26,7 +30,8 @@ def parse_input(input_path):
     return result
 
 
-def simulate(t_max, costs):
+def simulate_bfs(t_max, costs):
+    """ Breadth-first search over every (resources, robots) state, minute by minute """
     ore_cost_ore, clay_cost_ore, obs_cost_ore, obs_cost_clay, geo_cost_ore, geo_cost_obs = costs
     ore_max = max([ore_cost_ore, clay_cost_ore, obs_cost_ore, geo_cost_ore])
     clay_max = obs_cost_clay
@@ -94,34 +99,130 @@ def simulate(t_max, costs):
 
     return result
 
-def solve_part1(data):
+
+def simulate(t_max, costs):
+    """ Depth-first search over the order in which robots are built
+        Each branch skips straight to the minute the next robot can be built, so no time is spent on idle states, and
+        a geode robot is counted as every geode it will ever crack as soon as it is built. Branches are cut when an
+        optimistic bound on their geodes can not beat the best found so far
+    """
+    ore_cost_ore, clay_cost_ore, obs_cost_ore, obs_cost_clay, geo_cost_ore, geo_cost_obs = costs
+    # Only one robot is built per minute, so more robots than the largest cost of a resource are never needed
+    ore_max = max([ore_cost_ore, clay_cost_ore, obs_cost_ore, geo_cost_ore])
+    clay_max = obs_cost_clay
+    obs_max = geo_cost_obs
+    best = 0
+
+    def wait_for(cost, stock, robots):
+        """ Minutes until stock reaches cost, collecting from robots """
+        return 0 if stock >= cost else -(-(cost - stock) // robots)
+
+    def bound(t, obs, obs_robots, geo):
+        """ Geodes if an obsidian robot were free every minute, and ore were never short """
+        for t in range(t - 1, 0, -1):
+            if obs >= geo_cost_obs:
+                obs -= geo_cost_obs
+                geo += t
+            obs += obs_robots
+            obs_robots += 1
+        return geo
+
+    def search(t, ore, clay, obs, ore_robots, clay_robots, obs_robots, geo):
+        nonlocal best
+        if geo > best:
+            best = geo
+        if t <= 1 or bound(t, obs, obs_robots, geo) <= best:
+            return
+        # Build each robot next, in order of value, waiting until it is affordable. dt includes the minute to build it
+        if obs_robots:
+            dt = max(wait_for(geo_cost_ore, ore, ore_robots), wait_for(geo_cost_obs, obs, obs_robots)) + 1
+            if dt < t:
+                search(t - dt, ore + ore_robots * dt - geo_cost_ore, clay + clay_robots * dt,
+                       obs + obs_robots * dt - geo_cost_obs, ore_robots, clay_robots, obs_robots, geo + t - dt)
+        if clay_robots and obs_robots < obs_max:
+            dt = max(wait_for(obs_cost_ore, ore, ore_robots), wait_for(obs_cost_clay, clay, clay_robots)) + 1
+            if dt < t:
+                search(t - dt, ore + ore_robots * dt - obs_cost_ore, clay + clay_robots * dt - obs_cost_clay,
+                       obs + obs_robots * dt, ore_robots, clay_robots, obs_robots + 1, geo)
+        if clay_robots < clay_max:
+            dt = wait_for(clay_cost_ore, ore, ore_robots) + 1
+            if dt < t:
+                search(t - dt, ore + ore_robots * dt - clay_cost_ore, clay + clay_robots * dt, obs + obs_robots * dt,
+                       ore_robots, clay_robots + 1, obs_robots, geo)
+        if ore_robots < ore_max:
+            dt = wait_for(ore_cost_ore, ore, ore_robots) + 1
+            if dt < t:
+                search(t - dt, ore + ore_robots * dt - ore_cost_ore, clay + clay_robots * dt, obs + obs_robots * dt,
+                       ore_robots + 1, clay_robots, obs_robots, geo)
+
+    # Starting state: 1 ore robot
+    search(t_max, 0, 0, 0, 1, 0, 0, 0)
+    return best
+
+
+def simulate_blueprints(data, t_max, func=simulate, jobs=1):
+    """ Return the most geodes for each blueprint in data. If jobs > 1, blueprints are simulated over a process pool
+    """
+    t_maxes = [t_max] * len(data)
+    costs = [vals for n, *vals in data]
+    if jobs <= 1:
+        results = list(map(func, t_maxes, costs))
+    else:
+        with ProcessPoolExecutor(jobs) as executor:
+            results = list(executor.map(func, t_maxes, costs))
+    for (n, *_), result in zip(data, results):
+        log.info(f"Blueprint {n}: {result}")
+    return results
+
+
+def solve_part1(data, func=simulate, jobs=1):
     result = 0
-    for n, *vals in data:
-        _result = simulate(24, vals)
-        log.info(f"Blueprint {n}: {_result}")
+    for (n, *_), _result in zip(data, simulate_blueprints(data, 24, func, jobs)):
         result += n * _result
     return result
 
 
-def solve_part2(data):
+def solve_part2(data, func=simulate, jobs=1):
     result = 1
-    for n, *vals in data[:3]:
-        _result = simulate(32, vals)
-        log.info(f"Blueprint {n}: {_result}")
+    for _result in simulate_blueprints(data[:3], 32, func, jobs):
         result *= _result
     return result
 
 
+def run_benchmarks(data, jobs):
+    """ Compare the search engines on each part """
+    for title, solve in [("Part 1", solve_part1), ("Part 2", solve_part2)]:
+        rows = []
+        results = set()
+        for name, func in [("breadth-first", simulate_bfs), ("depth-first", simulate)]:
+            result, seconds, _ = benchmark(solve, data, func, jobs)
+            rows.append((name, seconds, None))
+            results.add(result)
+        log_benchmarks(f"{title}: {result}", rows)
+        if len(results) != 1:
+            log.error(f"{title}: engines disagree: {results}")
+
+
+def add_args(parser):
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="Worker processes, 0 for one per core")
+    parser.add_argument('-b', '--benchmark', action='store_true', help="Compare the depth and breadth-first searches")
+
+
 def main():
-    args = parse_args()
+    args = parse_args(add_args)
     data = parse_input(args.input)
+    jobs = args.jobs or os.cpu_count()
+
+    if args.benchmark:
+        run_benchmarks(data, jobs)
+        return
 
     log.always("Part 1:")
-    result = solve_part1(data)
+    result = solve_part1(data, jobs=jobs)
     log.always(result)
 
     log.always("Part 2:")
-    result = solve_part2(data[:3])
+    result = solve_part2(data[:3], jobs=jobs)
     log.always(result)
 
 
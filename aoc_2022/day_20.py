@@ -1,11 +1,26 @@
 #!/usr/bin/env python3
 
+import math
+import random
 import sys
 import traceback
 from common.utils import *
+from common.benchmark import *
 
 
-def simulate(data, reps=1):
+DECRYPTION_KEY = 811589153
+# Blocks hold about this many times sqrt(n) numbers. Finding a block is O(log n) in the Fenwick tree, so scanning
+# the block dominates, and blocks smaller than sqrt(n) are faster. Measured best from 5000 to 10^6 numbers
+BLOCK_SCALE = 0.25
+# Magnitude of generated numbers, as in the input
+GENERATE_RANGE = 10000
+# Benchmark sizes: (numbers, rounds). The list engine is only run up to BENCHMARK_LIST_SIZE numbers
+BENCHMARK_SIZES = [(5000, 10), (20000, 1), (100000, 1), (1000000, 1)]
+BENCHMARK_LIST_SIZE = 20000
+
+
+def simulate_list(data, reps=1):
+    """ List engine: every move finds, removes and inserts in a single list, so is O(n) """
     indices = list(range(len(data)))
     log.debug(f"Initial data: {[data[x] for x in indices]}")
     for rep in range(reps):
@@ -19,28 +34,130 @@ def simulate(data, reps=1):
     return [data[x] for x in indices]
 
 
-def solve_part1(data):
-    vals = simulate(data)
+def simulate(data, reps=1, block_size=None):
+    """ Block list engine: the mixed order is kept in blocks of about block_size numbers, sqrt decomposition
+        A number is found by its block, recorded for every number, and its position in that block. Block sizes are
+        kept in a Fenwick tree, so the position of a block, and the block holding a position, are O(log n). Each move
+        is then O(block_size + log n). Blocks are rebuilt evenly after every round
+    """
+    n = len(data)
+    if n < 2:
+        return list(data)
+    if block_size is None:
+        block_size = max(1, int(math.sqrt(n) * BLOCK_SCALE))
+    order = list(range(n))
+    for rep in range(reps):
+        log.info(f"Round {rep + 1} of {reps}")
+        blocks = [order[i:i + block_size] for i in range(0, n, block_size)]
+        n_blocks = len(blocks)
+        block_of = [0] * n
+        for b, block in enumerate(blocks):
+            for i in block:
+                block_of[i] = b
+        # Fenwick tree of block sizes, 1-indexed
+        tree = [0] * (n_blocks + 1)
+        for b, block in enumerate(blocks, 1):
+            tree[b] += len(block)
+            parent = b + (b & -b)
+            if parent <= n_blocks:
+                tree[parent] += tree[b]
+        top_step = 1 << (n_blocks.bit_length() - 1)
+
+        for i, value in enumerate(data):
+            # Find and remove i
+            b = block_of[i]
+            block = blocks[b]
+            offset = block.index(i)
+            del block[offset]
+            position = offset
+            j = b
+            while j:
+                position += tree[j]
+                j &= j - 1
+            j = b + 1
+            while j <= n_blocks:
+                tree[j] -= 1
+                j += j & -j
+
+            # Find the block holding the new position among the other n - 1 numbers, and insert i at it. The
+            # position is always below the total count, so the search ends in a block
+            remaining = (position + value) % (n - 1)
+            j = 0
+            step = top_step
+            while step:
+                k = j + step
+                if k <= n_blocks and tree[k] <= remaining:
+                    j = k
+                    remaining -= tree[k]
+                step >>= 1
+            blocks[j].insert(remaining, i)
+            block_of[i] = j
+            j += 1
+            while j <= n_blocks:
+                tree[j] += 1
+                j += j & -j
+        order = [i for block in blocks for i in block]
+        log.debug(f"Round {rep + 1} of {reps}: {[data[x] for x in order]}")
+    return [data[x] for x in order]
+
+
+def generate_data(count, seed=0):
+    """ Generate count numbers like the puzzle input: within +-GENERATE_RANGE with repeats, and exactly one 0 """
+    rng = random.Random(seed)
+    data = [rng.choice([-1, 1]) * rng.randint(1, GENERATE_RANGE) for _ in range(count - 1)]
+    data.insert(rng.randrange(count), 0)
+    return data
+
+
+def grove_coordinates(vals):
+    """ Sum of the numbers 1000, 2000 and 3000 after 0 """
     index = vals.index(0)
-    result = 0
-    for i in [1000, 2000, 3000]:
-        result += vals[(index + i) % len(vals)]
-    return result
+    return sum(vals[(index + i) % len(vals)] for i in [1000, 2000, 3000])
+
+
+def run_benchmarks(seed=0):
+    """ Compare the engines on generated data, checking the mixed orders are identical """
+    for count, reps in BENCHMARK_SIZES:
+        data = [x * DECRYPTION_KEY for x in generate_data(count, seed)]
+        rows = []
+        results = {}
+        funcs = [("list", simulate_list), ("blocks", simulate)]
+        if count > BENCHMARK_LIST_SIZE:
+            funcs = funcs[1:]
+        for name, func in funcs:
+            results[name], seconds, _ = benchmark(func, data, reps)
+            rows.append((name, seconds, None))
+        log_benchmarks(f"{count} numbers, {reps} rounds: {grove_coordinates(results['blocks'])}", rows)
+        if len(set(map(tuple, results.values()))) != 1:
+            log.error(f"{count} numbers: engines disagree")
+
+
+def solve_part1(data):
+    return grove_coordinates(simulate(data))
 
 
 def solve_part2(data):
-    _data = [x * 811589153 for x in data]
-    vals = simulate(_data, 10)
-    index = vals.index(0)
-    result = 0
-    for i in [1000, 2000, 3000]:
-        result += vals[(index + i) % len(vals)]
-    return result
+    _data = [x * DECRYPTION_KEY for x in data]
+    return grove_coordinates(simulate(_data, 10))
+
+
+def add_args(parser):
+    parser.add_argument('-b', '--benchmark', action='store_true', help="Compare the block list and list engines")
+    parser.add_argument('--generate', type=int, default=None, help="Use n generated numbers instead of input")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for --generate and --benchmark")
 
 
 def main():
-    args = parse_args()
-    data = read_list_int(args.input, to_list=True)
+    args = parse_args(add_args)
+    if args.benchmark:
+        run_benchmarks(args.seed)
+        return
+
+    if args.generate is not None:
+        data = generate_data(args.generate, args.seed)
+        log.always(f"Generated {len(data)} numbers")
+    else:
+        data = read_list_int(args.input, to_list=True)
 
     log.always("Part 1:")
     result = solve_part1(data)
@@ -1,9 +1,26 @@
 #!/usr/bin/env python3
 
 import collections
+import math
 import sys
+import time
 import traceback
+
+import numpy as np
+
 from common.utils import *
+from common.benchmark import *
+
+
+# Generated inputs are squares of this side, scaled by the square root of the scale so elves scale with it, and
+# about half full like the input
+GENERATE_SIDE = 75
+GENERATE_DENSITY = 0.5
+# Empty cells added on every side of the board when an elf reaches the edge
+GROW_MARGIN = 16
+# Synthetic scales run by the benchmark, the bitboard engine only above BENCHMARK_SETS_SCALE
+BENCHMARK_SCALES = [1, 10]
+BENCHMARK_SETS_SCALE = 1
 
 
 DIRECTIONS = {
@@ -76,7 +93,8 @@ def simulate(elves, moves):
     return result, _moved
 
 
-def solve(data, verbose=False):
+def solve_sets(data, verbose=False):
+    """ Set engine: every elf is a coordinate in a set, moved one at a time """
     # Convert elves to set of coordinates
     elves = set()
     for y, line in enumerate(data):
@@ -107,11 +125,146 @@ def solve(data, verbose=False):
     return result_1, result_2
 
 
+###############################################################################
+# Bitboard engine: the board is a 2D NumPy bool array, and each rule is applied to every elf at once
+
+
+def parse_board(data):
+    """ Return the board as a bool array, with a border of GROW_MARGIN empty cells """
+    board = np.array([[v == "#" for v in line] for line in data], dtype=bool)
+    return np.pad(board, GROW_MARGIN)
+
+
+def step_board(board, moves):
+    """ Run one round over board, which must have no elves on its edge. Return (new board, number of elves moved) """
+    # Occupancy of each neighbour of every cell inside the edge, by shifted views of the board
+    neighbours = {
+        "N": board[:-2, 1:-1], "NE": board[:-2, 2:], "E": board[1:-1, 2:], "SE": board[2:, 2:],
+        "S": board[2:, 1:-1], "SW": board[2:, :-2], "W": board[1:-1, :-2], "NW": board[:-2, :-2],
+    }
+    elves = board[1:-1, 1:-1]
+    # Only elves with any neighbour propose a move
+    remaining = elves & np.logical_or.reduce(list(neighbours.values()))
+    # Proposed destinations for each direction, over the whole board
+    targets = {}
+    for _dir, dirs in moves:
+        proposed = remaining & ~(neighbours[dirs[0]] | neighbours[dirs[1]] | neighbours[dirs[2]])
+        remaining &= ~proposed
+        target = np.zeros_like(board)
+        dx, dy = DIRECTIONS[_dir]
+        target[1 + dy:board.shape[0] - 1 + dy, 1 + dx:board.shape[1] - 1 + dx] = proposed
+        targets[_dir] = target
+
+    # Two elves can only propose the same cell from opposite sides: an elf proposing N needs the cells either side
+    # of its destination empty, so no elf proposing W or E can be there
+    board = board.copy()
+    moved = 0
+    for _dir, opposite in [("N", "S"), ("S", "N"), ("W", "E"), ("E", "W")]:
+        target = targets[_dir] & ~targets[opposite]
+        if not target.any():
+            continue
+        moved += int(np.count_nonzero(target))
+        board |= target
+        # Clear the cell each elf moved from, one step back from its destination
+        dx, dy = DIRECTIONS[_dir]
+        board[1:-1, 1:-1] &= ~target[1 + dy:board.shape[0] - 1 + dy, 1 + dx:board.shape[1] - 1 + dx]
+    return board, moved
+
+
+def grow_board(board):
+    """ Add GROW_MARGIN empty cells on every side of board if any elf is on its edge """
+    if board[0].any() or board[-1].any() or board[:, 0].any() or board[:, -1].any():
+        return np.pad(board, GROW_MARGIN)
+    return board
+
+
+def empty_ground(board):
+    """ Empty cells within the smallest rectangle holding all elves """
+    rows = np.flatnonzero(board.any(axis=1))
+    columns = np.flatnonzero(board.any(axis=0))
+    return (rows[-1] - rows[0] + 1) * (columns[-1] - columns[0] + 1) - int(np.count_nonzero(board))
+
+
+def solve(data, stats=None):
+    """ Run the bitboard simulation until both parts are solved
+        If stats is a dict, the number of rounds run and the final board shape are stored in it
+    """
+    board = parse_board(data)
+    moves = MOVES
+    i = 0
+    result_1 = None
+    result_2 = None
+    start = time.perf_counter()
+    while result_1 is None or result_2 is None:
+        i += 1
+        board, moved = step_board(grow_board(board), moves)
+        moves = moves[1:] + moves[:1]
+        if not moved and result_2 is None:
+            result_2 = i
+        if i == 10:
+            result_1 = int(empty_ground(board))
+        if i % 100 == 0:
+            log.info(f"Round {i}: board {board.shape[0]}x{board.shape[1]}, {moved} elves moved, "
+                     f"{(time.perf_counter() - start) / i * 1000:.2f} ms per round")
+    if stats is not None:
+        stats["rounds"] = i
+        stats["shape"] = board.shape
+    return result_1, result_2
+
+
+def generate_elves(scale, seed=0):
+    """ Generate input lines with scale times as many elves as a puzzle input """
+    rng = np.random.default_rng(seed)
+    side = round(GENERATE_SIDE * math.sqrt(scale))
+    board = rng.random((side, side)) < GENERATE_DENSITY
+    return ["".join("#" if v else "." for v in row) for row in board]
+
+
+def run_benchmarks(data, seed=0):
+    """ Compare the engines on the input and on generated inputs, with the time per round """
+    for title, _data, sets in [("Input", data, True)] + [
+            (f"Synthetic x{scale}", generate_elves(scale, seed), scale <= BENCHMARK_SETS_SCALE)
+            for scale in BENCHMARK_SCALES]:
+        rows = []
+        results = set()
+        stats = {}
+        engines = [("sets", lambda: solve_sets(_data))] if sets else []
+        engines.append(("bitboard", lambda: solve(_data, stats)))
+        for name, func in engines:
+            result, seconds, _ = benchmark(func)
+            rows.append((name, seconds, None))
+            results.add(result)
+        n_elves = sum(line.count("#") for line in _data)
+        log_benchmarks(f"{title}: {n_elves} elves, {result}, board {stats['shape'][0]}x{stats['shape'][1]}, "
+                       f"{seconds / stats['rounds'] * 1000:.2f} ms per round", rows)
+        if len(results) != 1:
+            log.error(f"{title}: engines disagree: {results}")
+
+
+def add_args(parser):
+    parser.add_argument('-e', '--engine', choices=["bitboard", "sets"], default="bitboard", help="Simulation engine")
+    parser.add_argument('-b', '--benchmark', action='store_true', help="Compare the engines")
+    parser.add_argument('--synthetic', type=int, default=None,
+                        help="Solve a generated input with n times as many elves instead of input")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for --synthetic and --benchmark")
+
+
 def main():
-    args = parse_args()
-    data = read_lines(args.input, to_list=True)
+    args = parse_args(add_args)
+    if args.synthetic is not None:
+        data = generate_elves(args.synthetic, args.seed)
+        log.always(f"Generated {sum(line.count('#') for line in data)} elves")
+    else:
+        data = read_lines(args.input, to_list=True)
+
+    if args.benchmark:
+        run_benchmarks(data, args.seed)
+        return
 
-    result_1, result_2 = solve(data, verbose=(args.verbose >= 1))
+    if args.engine == "sets":
+        result_1, result_2 = solve_sets(data, verbose=(args.verbose >= 1))
+    else:
+        result_1, result_2 = solve(data)
 
     log.always("Part 1:")
     log.always(result_1)
@@ -3,7 +3,12 @@
 import collections
 import sys
 import traceback
+
+import numpy as np
+
 from common.utils import *
+from common.benchmark import *
+from common.search import *
 
 
 DIRS = {
@@ -24,6 +29,46 @@ MOVES = {
 
 
 def solve(lines, move_min, move_max):
+    """ Find the cheapest path from the top left to the bottom right, moving between move_min and move_max blocks
+        in a straight line before turning. A state is a flat index and the axis of the last move: as the next move
+        must turn, only the axis matters. States are packed into ints and searched with A* over a bucket queue
+    """
+    grid = FlatGrid(np.array([[int(c) for c in line] for line in lines]), fill=-1)
+    cells = grid.cells
+    # Axis 0 moves vertically, axis 1 horizontally
+    axis_offsets = [grid.offsets[1:3], grid.offsets[0:4:3]]
+    packer = StatePacker(len(cells), 2)
+    end = grid.index(len(lines) - 1, len(lines[0]) - 1)
+
+    def neighbours(state):
+        # packer.unpack() and packer.pack(), inlined
+        index, axis = divmod(state, 2)
+        result = []
+        # Turn onto the other axis
+        for offset in axis_offsets[axis]:
+            _index = index
+            _cost = 0
+            for step in range(1, move_max + 1):
+                _index += offset
+                cost = cells[_index]
+                if cost < 0:
+                    break
+                _cost += cost
+                if step >= move_min:
+                    result.append((_index * 2 + 1 - axis, _cost))
+        return result
+
+    def is_goal(state):
+        return state // 2 == end
+
+    heuristic = manhattan_heuristic(grid, end)
+    start = grid.index(0, 0)
+    cost, _ = astar([packer.pack(start, 0), packer.pack(start, 1)], neighbours, is_goal,
+                    lambda state: heuristic(state // 2), bucket_queue=True)
+    return cost
+
+
+def solve_heapq(lines, move_min, move_max):
     data = {x + y * 1j: int(c) for y, line in enumerate(lines) for x, c in enumerate(line)}
     end = max(x.real for x in data) + max(y.imag for y in data) * 1j
     # Queue of nodes to explore: (cost, index, position, entry_direction)
@@ -53,8 +98,12 @@ def solve(lines, move_min, move_max):
     return None
 
 
+def add_args(parser):
+    parser.add_argument('-b', '--benchmark', action='store_true', help="Compare the A* search with the old Dijkstra")
+
+
 def main():
-    args = parse_args()
+    args = parse_args(add_args)
     lines = read_lines(args.input, to_list=True)
 
     log.always("Part 1:")
@@ -65,6 +114,14 @@ def main():
     result = solve(lines, 4, 10)
     log.always(result)
 
+    if args.benchmark:
+        for title, move_min, move_max in [("Part 1", 1, 3), ("Part 2", 4, 10)]:
+            rows = []
+            for name, func in [("heapq tuples", solve_heapq), ("common.search", solve)]:
+                _, seconds, _ = benchmark(func, lines, move_min, move_max)
+                rows.append((name, seconds, None))
+            log_benchmarks(title, rows)
+
 
 if __name__ == "__main__":
     # noinspection PyBroadException
@@ -0,0 +1,66 @@
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from common.utils import log
+
+
+__all__ = [
+    "benchmark", "log_benchmarks", "peak_rss",
+]
+
+
+def benchmark(func, *args, repeat=1, trace_memory=False, **kwargs):
+    """ Call func(*args, **kwargs) repeat times
+        Return (result, best wall time in seconds, peak traced memory in bytes)
+        Peak memory is only measured if trace_memory, otherwise it is None. Tracing slows execution down, so
+        the wall time of a traced run is not comparable with an untraced one
+    """
+    result = None
+    best = None
+    peak = None
+    for _ in range(repeat):
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            if trace_memory:
+                _, _peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                peak = _peak if peak is None else max(peak, _peak)
+        if best is None or elapsed < best:
+            best = elapsed
+    return result, best, peak
+
+
+def log_benchmarks(title, rows):
+    """ Log a table of (name, seconds, peak_bytes) rows, with the speed-up of each row relative to the first """
+    log.always(title)
+    if not rows:
+        return
+    reference = rows[0][1]
+    for name, seconds, peak in rows:
+        speedup = reference / seconds if seconds else float("inf")
+        peak_str = f"{peak / 1024:10.1f} KiB" if peak is not None else " " * 14
+        log.always(f"  {name:<24} {seconds:10.4f} s {peak_str} {speedup:8.2f}x")
+
+
+def peak_rss(children=False):
+    """ Peak resident set size of this process in bytes, or None where the resource module is not available (Windows)
+        If children, the larger of this process and any child process it has waited for
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if children:
+        max_rss = max(max_rss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
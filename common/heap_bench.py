@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+import heapq
+import random
+import sys
+import traceback
+
+import numpy as np
+
+from common.utils import *
+from common.benchmark import *
+from common.search import *
+
+
+###############################################################################
+# Push/pop: N distinct keys with random priorities pushed then all popped
+
+
+def push_pop_heapq(items):
+    """ heapq """
+    h = []
+    for item in items:
+        heapq.heappush(h, item)
+    return [heapq.heappop(h)[0] for _ in range(len(h))]
+
+
+def push_pop_heapq_wrapper(items):
+    """ HeapQ """
+    h = HeapQ(items)
+    result = []
+    while h:
+        result.append(h.pop()[0])
+    return result
+
+
+def push_pop_indexed(items):
+    """ IndexedHeap """
+    h = IndexedHeap()
+    for priority, key in items:
+        h.push(priority, key)
+    result = []
+    while h:
+        result.append(h.pop()[0])
+    return result
+
+
+def heapify_heapq(items):
+    """ heapq.heapify """
+    h = list(items)
+    heapq.heapify(h)
+    return len(h)
+
+
+def heapify_indexed(items):
+    """ IndexedHeap.heapify """
+    return len(IndexedHeap.heapify(items))
+
+
+###############################################################################
+# Dijkstra over a grid of risks: each returns (cost, pops, peak frontier size)
+
+
+def grid_graph(grid):
+    """ Flat grid of costs, with a border of -1, and neighbour offsets """
+    flat = FlatGrid(grid, fill=-1)
+    return flat.cells, flat.offsets, flat.index(0, 0), flat.index(grid.shape[0] - 1, grid.shape[1] - 1)
+
+
+def dijkstra_heapq(cells, offsets, start, goal):
+    """ heapq, stale duplicates """
+    best = {start: 0}
+    h = [(0, start)]
+    closed = set()
+    pops = 0
+    peak = 1
+    while h:
+        cost, index = heapq.heappop(h)
+        pops += 1
+        if index in closed:
+            continue
+        closed.add(index)
+        if index == goal:
+            return cost, pops, peak
+        for offset in offsets:
+            _index = index + offset
+            risk = cells[_index]
+            if risk < 0:
+                continue
+            _cost = cost + risk
+            if _cost < best.get(_index, _cost + 1):
+                best[_index] = _cost
+                heapq.heappush(h, (_cost, _index))
+        peak = max(peak, len(h))
+    return None, pops, peak
+
+
+def dijkstra_indexed(cells, offsets, start, goal):
+    """ IndexedHeap decrease-key """
+    h = IndexedHeap([(0, start)])
+    closed = set()
+    pops = 0
+    peak = 1
+    while h:
+        cost, index = h.pop()
+        pops += 1
+        closed.add(index)
+        if index == goal:
+            return cost, pops, peak
+        for offset in offsets:
+            _index = index + offset
+            risk = cells[_index]
+            if risk < 0 or _index in closed:
+                continue
+            h.push(cost + risk, _index)
+        peak = max(peak, len(h))
+    return None, pops, peak
+
+
+def add_bench_args(parser):
+    parser.add_argument('-r', '--repeat', type=int, default=3, help="Runs per benchmark, the best time is reported")
+    parser.add_argument('-s', '--scale', type=int, default=5, help="Tile the grid scale times in each direction")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for push/pop priorities")
+
+
+def main():
+    """ Benchmark IndexedHeap against heapq. input is a grid of digit risks, e.g. 2021 day 15 """
+    args = parse_args(add_bench_args)
+    grid = np.array([[int(c) for c in line] for line in read_lines(args.input, to_list=True)])
+    # Tile as in 2021 day 15 part 2, risks wrapping from 9 to 1
+    grid = np.block([[(grid + i + j - 1) % 9 + 1 for i in range(args.scale)] for j in range(args.scale)])
+
+    rng = random.Random(args.seed)
+    items = [(rng.randrange(grid.size), key) for key in range(grid.size)]
+    for title, funcs in [
+        (f"Push then pop {len(items)} items", [push_pop_heapq, push_pop_heapq_wrapper, push_pop_indexed]),
+        (f"Heapify {len(items)} items", [heapify_heapq, heapify_indexed]),
+    ]:
+        rows = []
+        results = set()
+        for func in funcs:
+            result, seconds, _ = benchmark(func, items, repeat=args.repeat)
+            results.add(repr(result))
+            rows.append((func.__doc__.strip(), seconds, None))
+        log_benchmarks(title, rows)
+        if len(results) != 1:
+            log.error(f"{title}: results disagree")
+
+    graph = grid_graph(grid)
+    rows = []
+    for func in [dijkstra_heapq, dijkstra_indexed]:
+        (cost, pops, peak), seconds, _ = benchmark(func, *graph, repeat=args.repeat)
+        rows.append((func.__doc__.strip(), seconds, None))
+        log.always(f"  {func.__doc__.strip():<24} cost {cost}, {pops} pops, peak frontier {peak}")
+    log_benchmarks(f"Dijkstra over a {grid.shape[0]}x{grid.shape[1]} grid", rows)
+
+
+if __name__ == "__main__":
+    # noinspection PyBroadException
+    try:
+        main()
+    except KeyboardInterrupt:
+        log.always("Killed")
+    except Exception:
+        traceback.print_exc()
+        sys.exit(-1)
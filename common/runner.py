@@ -0,0 +1,434 @@
+""" Run puzzle solutions across years and record a benchmark report
+
+    Run from the repository root:
+        python -m common.runner . [-y YEAR] [-d DAY] [-o report.json] [-b baseline.json] [--tracemalloc] [-j JOBS]
+
+    Every day runs in its own child process against its full input, or with --test against its test input and with
+    -t passed to the script. The child splits the run into parts at the "Part 1" and "Part 2" log messages, and
+    records wall time, peak RSS so far, tracemalloc peak (if enabled) and the last logged answer of each part. A day
+    that does its work before logging the part markers cannot be split, and its parts are reported "unsplit", with
+    no time of their own. Reports are written as JSON or CSV, and can be compared against a saved baseline to flag
+    regressions. With -j, days run in parallel, longest first according to a previous report.
+"""
+import csv
+import glob
+import json
+import logging
+import os
+import re
+import runpy
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from common.utils import *
+from common.benchmark import peak_rss
+
+
+__all__ = [
+    "DaySpec", "discover", "schedule", "run_day", "run_days", "write_report", "read_report", "compare_reports",
+]
+
+
+# First argument that makes this module run a single day as a child process
+CHILD_FLAG = "--child"
+# Log messages that start each part
+RE_PART_MARKER = re.compile(r"^Part ([12]):?$")
+# Columns of a report row
+# max_rss_so_far_kib is the high-water mark of the process at the end of a part, which includes earlier parts.
+# timing of a part is "unsplit" if its day computes everything before logging its part markers, "split" otherwise
+REPORT_FIELDS = [
+    "year", "day", "input", "part", "status", "timing", "seconds", "max_rss_so_far_kib", "tracemalloc_peak_kib",
+    "answer",
+]
+# A day is unsplit if more time than this, and more than its parts took, passed before its first part marker
+UNSPLIT_MIN_SECONDS = 0.01
+# Days whose -t flag does something other than select test input sizes, so that are not run with --test
+TEST_EXCLUDED = {
+    (2019, 25): "-t plays the game interactively",
+}
+
+
+class DaySpec:
+    """ A day solution script and the input it is run against. If test, the script is run with -t """
+    def __init__(self, year, day, script, input_file, test=False):
+        self.year = year
+        self.day = day
+        self.script = script
+        self.input_file = input_file
+        self.test = test
+
+    @property
+    def name(self):
+        return f"{self.year} day {self.day:02d}"
+
+    def __repr__(self):
+        return f"DaySpec({self.year}, {self.day})"
+
+
+def discover(root, years=None, days=None, test=False):
+    """ Find day scripts under root (a repository or a single year directory) that have an input file
+        Full inputs are named input/day_NN_full.txt, or input/day_NN.txt. If test, use input/day_NN_test.txt, and
+        skip the days in TEST_EXCLUDED
+    """
+    root = os.path.abspath(root)
+    if re.match(r"aoc_\d{4}$", os.path.basename(root)):
+        year_dirs = [root]
+    else:
+        year_dirs = sorted(glob.glob(os.path.join(root, "aoc_[0-9][0-9][0-9][0-9]")))
+    result = []
+    for year_dir in year_dirs:
+        year = int(os.path.basename(year_dir)[4:])
+        if years and year not in years:
+            continue
+        for script in sorted(glob.glob(os.path.join(year_dir, "day_[0-9][0-9].py"))):
+            day = int(os.path.basename(script)[4:6])
+            if days and day not in days:
+                continue
+            if test and (year, day) in TEST_EXCLUDED:
+                log.info(f"{year} day {day:02d}: {TEST_EXCLUDED[year, day]}, skipping")
+                continue
+            names = [f"day_{day:02d}_test.txt"] if test else [f"day_{day:02d}_full.txt", f"day_{day:02d}.txt"]
+            for name in names:
+                input_file = os.path.join(year_dir, "input", name)
+                if os.path.exists(input_file):
+                    result.append(DaySpec(year, day, script, input_file, test))
+                    break
+            else:
+                log.info(f"{year} day {day:02d}: no input, skipping")
+    return result
+
+
+###############################################################################
+# Child process: run one day in-process, measuring each part
+
+
+class _PartRecorder(logging.Handler):
+    """ Log handler that splits a run into parts at part markers, and records measurements for each part """
+    def __init__(self, trace_memory):
+        super().__init__(logging.NOTSET)
+        self.trace_memory = trace_memory
+        self.parts = {}
+        self.part = None
+        self.answer = None
+        self.tracemalloc_peak_kib = None
+        self.start = time.perf_counter()
+        self.part_start = self.start
+        self.first_part_start = None
+
+    def emit(self, record):
+        message = str(record.getMessage()).strip()
+        m = RE_PART_MARKER.match(message)
+        if m:
+            part = int(m.group(1))
+            if part != self.part:
+                self.finish_part()
+                self.part = part
+                if self.first_part_start is None:
+                    self.first_part_start = self.part_start
+        elif record.levelno >= logging.CRITICAL and message:
+            self.answer = message
+
+    def finish_part(self):
+        """ Record measurements for the current part, and reset them for the next one """
+        now = time.perf_counter()
+        peak_kib = None
+        if self.trace_memory:
+            peak_kib = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.reset_peak()
+            self.tracemalloc_peak_kib = max(self.tracemalloc_peak_kib or 0, peak_kib)
+        if self.part is not None:
+            self.parts[self.part] = {
+                "seconds": now - self.part_start,
+                "max_rss_so_far_kib": _max_rss_kib(),
+                "tracemalloc_peak_kib": peak_kib,
+                "answer": self.answer,
+            }
+        self.part_start = now
+        self.answer = None
+
+    def unsplit(self):
+        """ Whether the work was done before the part markers were logged, so that the parts took no time of their own
+        """
+        if self.first_part_start is None:
+            return False
+        before = self.first_part_start - self.start
+        return before > UNSPLIT_MIN_SECONDS and before > sum(part["seconds"] for part in self.parts.values())
+
+
+def _max_rss_kib():
+    """ Peak resident set size in KiB, if available: the larger of this process and any child process it has waited
+        for, so that days that run a process pool report the memory of their workers
+    """
+    max_rss = peak_rss(children=True)
+    return None if max_rss is None else max_rss / 1024
+
+
+def child_main(argv):
+    """ Run one day script with its input, and write measurements as JSON to result_file
+        argv: script input_file result_file [--tracemalloc] [--test]
+    """
+    script, input_file, result_file = argv[:3]
+    trace_memory = "--tracemalloc" in argv[3:]
+    script_dir = os.path.dirname(os.path.abspath(script))
+    os.chdir(script_dir)
+    sys.path.insert(0, script_dir)
+    # Days size their puzzle (grid sizes, iteration counts) for the test input with -t
+    sys.argv = [script, input_file] + (["-t"] if "--test" in argv[3:] else [])
+
+    recorder = _PartRecorder(trace_memory)
+    log.addHandler(recorder)
+    if trace_memory:
+        tracemalloc.start()
+    status = "ok"
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            status = "error"
+    except BaseException as e:
+        status = f"error: {e!r}"
+    recorder.finish_part()
+    result = {
+        "status": status,
+        "seconds": time.perf_counter() - recorder.start,
+        "max_rss_so_far_kib": _max_rss_kib(),
+        "tracemalloc_peak_kib": recorder.tracemalloc_peak_kib,
+        "parts": recorder.parts,
+        "unsplit": recorder.unsplit(),
+    }
+    with open(result_file, "w") as f:
+        json.dump(result, f)
+
+
+###############################################################################
+# Parent process: run days and report
+
+
+def _kill_process_group(proc):
+    """ Kill proc and every process in its process group, where process groups are supported """
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        proc.kill()
+
+
+def run_day(spec, trace_memory=False, timeout=None):
+    """ Run a day in a child process. Return a list of report rows: one per part, and one for the whole run
+        A day that runs for longer than timeout seconds is killed, and reported with status "timeout"
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        result_file = os.path.join(tmp_dir, "result.json")
+        args = [sys.executable, "-m", "common.runner", CHILD_FLAG, spec.script, spec.input_file, result_file]
+        if trace_memory:
+            args.append("--tracemalloc")
+        if spec.test:
+            args.append("--test")
+        start = time.perf_counter()
+        # The child leads its own process group, so that a timeout also kills the workers of days with a process pool
+        proc = subprocess.Popen(
+            args, cwd=os.path.dirname(spec.script), start_new_session=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        try:
+            _, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill_process_group(proc)
+            proc.communicate()
+            result = {"status": "timeout", "seconds": time.perf_counter() - start, "parts": {}}
+            stderr = ""
+        else:
+            try:
+                with open(result_file) as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                result = {"status": f"error: exit code {proc.returncode}", "seconds": time.perf_counter() - start,
+                          "parts": {}}
+    if result["status"] != "ok" and stderr.strip():
+        # Day scripts print tracebacks and exit: report the last line
+        result["status"] = f"error: {stderr.strip().splitlines()[-1]}"
+
+    rows = []
+    unsplit = result.get("unsplit", False)
+    for part, measurements in sorted(result["parts"].items()):
+        row = _row(spec, int(part), result["status"], **measurements)
+        row["timing"] = "unsplit" if unsplit else "split"
+        if unsplit:
+            row["seconds"] = None
+        rows.append(row)
+    rows.append(_row(
+        spec, "total", result["status"], result["seconds"],
+        result.get("max_rss_so_far_kib"), result.get("tracemalloc_peak_kib"), None,
+    ))
+    return rows
+
+
+def schedule(specs, history_rows=None):
+    """ Order specs longest job first, by total seconds in history_rows (a previous report)
+        Days with no history are scheduled first, as they may be long
+    """
+    seconds = {(row["year"], row["day"]): row["seconds"] for row in history_rows or () if str(row["part"]) == "total"}
+    return sorted(specs, key=lambda spec: -seconds.get((spec.year, spec.day), float("inf")))
+
+
+def run_days(specs, jobs=1, trace_memory=False, timeout=None, history_rows=None, callback=None):
+    """ Run days, up to jobs at a time, longest first. Return report rows in the order of specs
+        Each day runs in its own child process with its own logging configuration; worker threads only wait on
+        children. callback(spec, rows) is called as each day finishes
+    """
+    results = {}
+    with ThreadPoolExecutor(max(1, jobs)) as executor:
+        futures = {
+            executor.submit(run_day, spec, trace_memory, timeout): spec for spec in schedule(specs, history_rows)
+        }
+        for future in as_completed(futures):
+            spec = futures[future]
+            results[spec] = future.result()
+            if callback is not None:
+                callback(spec, results[spec])
+    return [row for spec in specs for row in results[spec]]
+
+
+def _row(spec, part, status, seconds, max_rss_so_far_kib=None, tracemalloc_peak_kib=None, answer=None):
+    return {
+        "year": spec.year, "day": spec.day, "input": "test" if spec.test else "full", "part": part, "status": status,
+        "timing": None, "seconds": seconds, "max_rss_so_far_kib": max_rss_so_far_kib,
+        "tracemalloc_peak_kib": tracemalloc_peak_kib, "answer": answer,
+    }
+
+
+def write_report(path, rows, trace_memory=False, test=False):
+    """ Write report rows to path, as CSV if path ends with .csv, otherwise as JSON """
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        report = {
+            "python": sys.version.split()[0],
+            "tracemalloc": trace_memory,
+            "test": test,
+            "results": rows,
+        }
+        with open(path, "w") as f:
+            json.dump(report, f, indent=1)
+
+
+def read_report(path):
+    """ Read report rows written by write_report """
+    if path.endswith(".csv"):
+        rows = []
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                row["year"] = int(row["year"])
+                row["day"] = int(row["day"])
+                row["part"] = int(row["part"]) if row["part"].isdigit() else row["part"]
+                for field in ["seconds", "max_rss_so_far_kib", "tracemalloc_peak_kib"]:
+                    row[field] = float(row[field]) if row[field] else None
+                row["answer"] = row["answer"] or None
+                rows.append(row)
+        return rows
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def _row_key(row):
+    return row["year"], row["day"], row["input"], str(row["part"])
+
+
+def compare_reports(rows, baseline_rows, threshold=0.25, min_seconds=0.1, min_kib=1024):
+    """ Compare report rows against baseline rows. Return a list of regression descriptions
+        Time and memory regress if they grow by more than threshold (a fraction) and by more than the noise
+        floor min_seconds/min_kib. A changed answer, or a day that no longer runs, is always a regression
+    """
+    baseline = {_row_key(row): row for row in baseline_rows}
+    regressions = []
+    for row in rows:
+        base = baseline.get(_row_key(row))
+        if base is None:
+            continue
+        name = f"{row['year']} day {row['day']:02d} part {row['part']}"
+        if row["status"] != "ok":
+            if base["status"] == "ok":
+                regressions.append(f"{name}: {row['status']}")
+            continue
+        if base["answer"] != row["answer"]:
+            regressions.append(f"{name}: answer changed from {base['answer']} to {row['answer']}")
+        for field, floor, unit in [
+            ("seconds", min_seconds, "s"),
+            ("max_rss_so_far_kib", min_kib, " KiB"),
+            ("tracemalloc_peak_kib", min_kib, " KiB"),
+        ]:
+            old = base.get(field)
+            new = row.get(field)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + threshold) and new - old > floor:
+                regressions.append(f"{name}: {field} {old:.3f}{unit} -> {new:.3f}{unit} ({new / old if old else 0:.2f}x)")
+    return regressions
+
+
+def log_row(row):
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else "-"
+    seconds = f"{'unsplit':>11}" if row.get("timing") == "unsplit" else f"{fmt(row['seconds'], '9.3f')} s"
+    log.always(
+        f"{row['year']} day {row['day']:02d} part {row['part']!s:<5} {seconds} "
+        f"{fmt(row['max_rss_so_far_kib'], '9.0f')} KiB RSS {fmt(row['tracemalloc_peak_kib'], '9.0f')} KiB traced  "
+        f"{row['status'] if row['status'] != 'ok' else row['answer'] or ''}"
+    )
+
+
+def add_runner_args(parser):
+    parser.add_argument('-y', '--year', type=int, action='append', help="Year(s) to run")
+    parser.add_argument('-d', '--day', type=int, action='append', help="Day(s) to run")
+    parser.add_argument('-o', '--output', help="Write report to this file (.json or .csv)")
+    parser.add_argument('-b', '--baseline', help="Compare against this saved report and flag regressions")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Relative growth that counts as a regression")
+    parser.add_argument('--tracemalloc', action='store_true', help="Trace Python allocations (slows execution)")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="Days to run in parallel, 0 for one per core")
+    parser.add_argument('--history', help="Previous report used to run the longest days first (default: baseline)")
+    parser.add_argument('--timeout', type=float, default=None, help="Per-day timeout in seconds")
+
+
+def main():
+    """ input is the repository root, or a single year directory """
+    args = parse_args(add_runner_args)
+    specs = discover(args.input, args.year, args.day, args.test)
+    jobs = args.jobs or os.cpu_count()
+    history = args.history or args.baseline
+    history_rows = read_report(history) if history else None
+    log.always(f"Running {len(specs)} days{' on test inputs' if args.test else ''}, {jobs} at a time")
+
+    def callback(spec, day_rows):
+        for row in day_rows:
+            log_row(row)
+
+    start = time.perf_counter()
+    rows = run_days(specs, jobs, args.tracemalloc, args.timeout, history_rows, callback)
+    log.always(f"Finished in {time.perf_counter() - start:.3f} s")
+
+    if args.output:
+        write_report(args.output, rows, args.tracemalloc, args.test)
+    if args.baseline:
+        regressions = compare_reports(rows, read_report(args.baseline), args.threshold)
+        log.always(f"{len(regressions)} regressions against {args.baseline}")
+        for regression in regressions:
+            log.always(f"  {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == CHILD_FLAG:
+        child_main(sys.argv[2:])
+    else:
+        main()
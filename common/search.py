@@ -0,0 +1,331 @@
+import heapq
+import itertools
+
+import numpy as np
+
+
+__all__ = [
+    "BucketQueue", "IndexedHeap", "StatePacker",
+    "astar", "dijkstra",
+    "FlatGrid", "grid_search", "manhattan_heuristic",
+]
+
+
+class BucketQueue:
+    """ Monotone priority queue for small non-negative integer priorities (Dial's algorithm)
+        Items are kept in one bucket per priority, and pop scans forward from the last priority popped, so push and
+        pop are O(1) amortised. Popped priorities must never decrease: pushing below the last popped priority fails
+    """
+    def __init__(self, items=None):
+        self._buckets = []
+        self._cursor = 0
+        self._len = 0
+        if items is not None:
+            for priority, item in items:
+                self.push(priority, item)
+
+    def push(self, priority, item):
+        if priority < self._cursor:
+            raise ValueError(f"Priority {priority} is below the last popped priority {self._cursor}")
+        buckets = self._buckets
+        if priority >= len(buckets):
+            buckets.extend([] for _ in range(priority + 1 - len(buckets)))
+        buckets[priority].append(item)
+        self._len += 1
+
+    def pop(self):
+        """ Remove and return (priority, item) with the lowest priority """
+        if not self._len:
+            raise IndexError("pop from empty BucketQueue")
+        buckets = self._buckets
+        cursor = self._cursor
+        while not buckets[cursor]:
+            cursor += 1
+        self._cursor = cursor
+        self._len -= 1
+        return cursor, buckets[cursor].pop()
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+
+class IndexedHeap:
+    """ Binary min-heap of unique hashable keys, each with a priority, that supports decrease-key
+        A position index maps every key to its slot in the heap, so pushing a key that is already queued lowers its
+        priority in place instead of adding a stale duplicate. Keys themselves are never compared, only priorities
+    """
+    def __init__(self, items=None):
+        self._priorities = []
+        self._keys = []
+        self._positions = {}
+        if items is not None:
+            for priority, key in items:
+                if key not in self._positions or priority < self._priorities[self._positions[key]]:
+                    self._positions[key] = len(self._keys)
+                    self._priorities.append(priority)
+                    self._keys.append(key)
+            # Only the last of any duplicate keys is indexed, so drop the others before heapifying
+            if len(self._keys) != len(self._positions):
+                self._keys = [key for i, key in enumerate(self._keys) if self._positions[key] == i]
+                self._priorities = [self._priorities[self._positions[key]] for key in self._keys]
+                self._positions = {key: i for i, key in enumerate(self._keys)}
+            for i in reversed(range(len(self._keys) // 2)):
+                self._sift_down(i)
+
+    @classmethod
+    def heapify(cls, items):
+        """ Build a heap from (priority, key) pairs in O(n). Duplicate keys keep their lowest priority """
+        return cls(items)
+
+    def push(self, priority, key):
+        """ Add key with priority, or lower the priority of key if it is already queued with a higher one
+            Return True if the heap changed
+        """
+        position = self._positions.get(key)
+        if position is None:
+            self._positions[key] = len(self._keys)
+            self._priorities.append(priority)
+            self._keys.append(key)
+            self._sift_up(len(self._keys) - 1)
+            return True
+        if priority < self._priorities[position]:
+            self._priorities[position] = priority
+            self._sift_up(position)
+            return True
+        return False
+
+    def decrease_key(self, key, priority):
+        """ Lower the priority of queued key. Raise KeyError if key is not queued """
+        position = self._positions[key]
+        if priority > self._priorities[position]:
+            raise ValueError(f"New priority {priority} is above the current priority {self._priorities[position]}")
+        self._priorities[position] = priority
+        self._sift_up(position)
+
+    def pop(self):
+        """ Remove and return (priority, key) with the lowest priority """
+        priorities = self._priorities
+        keys = self._keys
+        if not keys:
+            raise IndexError("pop from empty IndexedHeap")
+        priority = priorities[0]
+        key = keys[0]
+        del self._positions[key]
+        last_priority = priorities.pop()
+        last_key = keys.pop()
+        if keys:
+            priorities[0] = last_priority
+            keys[0] = last_key
+            self._positions[last_key] = 0
+            self._sift_down(0)
+        return priority, key
+
+    def peek(self):
+        """ Return (priority, key) with the lowest priority without removing it """
+        if not self._keys:
+            raise IndexError("peek at empty IndexedHeap")
+        return self._priorities[0], self._keys[0]
+
+    def priority(self, key):
+        """ Return the priority of queued key. Raise KeyError if key is not queued """
+        return self._priorities[self._positions[key]]
+
+    def _sift_up(self, position):
+        priorities = self._priorities
+        keys = self._keys
+        positions = self._positions
+        priority = priorities[position]
+        key = keys[position]
+        while position:
+            parent = (position - 1) >> 1
+            parent_priority = priorities[parent]
+            if not priority < parent_priority:
+                break
+            priorities[position] = parent_priority
+            keys[position] = parent_key = keys[parent]
+            positions[parent_key] = position
+            position = parent
+        priorities[position] = priority
+        keys[position] = key
+        positions[key] = position
+
+    def _sift_down(self, position):
+        priorities = self._priorities
+        keys = self._keys
+        positions = self._positions
+        size = len(keys)
+        priority = priorities[position]
+        key = keys[position]
+        child = 2 * position + 1
+        while child < size:
+            # Pick the smaller child
+            right = child + 1
+            if right < size and priorities[right] < priorities[child]:
+                child = right
+            child_priority = priorities[child]
+            if not child_priority < priority:
+                break
+            priorities[position] = child_priority
+            keys[position] = child_key = keys[child]
+            positions[child_key] = position
+            position = child
+            child = 2 * position + 1
+        priorities[position] = priority
+        keys[position] = key
+        positions[key] = position
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __bool__(self):
+        return bool(self._keys)
+
+
+class StatePacker:
+    """ Pack tuples of small non-negative integers into single ints, so search frontiers and visited sets hold ints
+        sizes gives the number of possible values of each field: StatePacker(width * height, 4) packs (position, dir)
+    """
+    def __init__(self, *sizes):
+        self.sizes = sizes
+        self.multipliers = []
+        multiplier = 1
+        for size in reversed(sizes):
+            self.multipliers.append(multiplier)
+            multiplier *= size
+        self.multipliers.reverse()
+        self.size = multiplier
+
+    def pack(self, *values):
+        result = 0
+        for value, multiplier in zip(values, self.multipliers):
+            result += value * multiplier
+        return result
+
+    def unpack(self, state):
+        result = []
+        for size in reversed(self.sizes):
+            state, value = divmod(state, size)
+            result.append(value)
+        return tuple(reversed(result))
+
+
+def astar(starts, neighbours, is_goal, heuristic=None, bucket_queue=False):
+    """ Find the cheapest path from any state in starts to a state where is_goal(state) is True
+        neighbours(state) yields (next_state, cost) pairs with non-negative costs.
+        heuristic(state) is a lower bound on the cost to reach a goal, which must be consistent
+        (heuristic(state) <= cost + heuristic(next_state)). Without a heuristic this is Dijkstra's algorithm.
+        If bucket_queue, all costs and heuristic values are small integers and a BucketQueue is used instead of a
+        binary heap. States must be hashable; ints (see StatePacker) are fastest.
+        Return (cost, goal_state), or (None, None) if no goal can be reached
+    """
+    best = {}
+    if bucket_queue:
+        queue = BucketQueue()
+        push = queue.push
+
+        def pop():
+            return queue.pop()[1]
+    else:
+        queue = []
+        counter = itertools.count()
+
+        def push(priority, state):
+            # Counter breaks ties, so that states themselves are never compared
+            heapq.heappush(queue, (priority, next(counter), state))
+
+        def pop():
+            return heapq.heappop(queue)[2]
+
+    for start in starts:
+        best[start] = 0
+        push(heuristic(start) if heuristic else 0, start)
+
+    closed = set()
+    while queue:
+        state = pop()
+        if state in closed:
+            # Stale entry: state was already expanded at a lower cost
+            continue
+        closed.add(state)
+        # With a consistent heuristic, the first time a state is expanded its best cost is optimal
+        cost = best[state]
+        if is_goal(state):
+            return cost, state
+        for next_state, edge_cost in neighbours(state):
+            _cost = cost + edge_cost
+            if _cost < best.get(next_state, _cost + 1):
+                best[next_state] = _cost
+                push(_cost + heuristic(next_state) if heuristic else _cost, next_state)
+    return None, None
+
+
+def dijkstra(starts, neighbours, is_goal, bucket_queue=False):
+    """ astar() without a heuristic """
+    return astar(starts, neighbours, is_goal, None, bucket_queue)
+
+
+class FlatGrid:
+    """ A 2D grid stored as a flat list, surrounded by a border of fill cells
+        Cells are numbered by flat index, and the neighbours of a cell are at the fixed offsets in self.offsets,
+        so searches need no bounds checks as long as border cells are never entered
+    """
+    def __init__(self, array, fill=-1, diagonal=False):
+        self.shape = array.shape
+        self.width = array.shape[1] + 2
+        self.cells = np.pad(array, 1, constant_values=fill).ravel().tolist()
+        width = self.width
+        self.offsets = (-width, -1, 1, width)
+        if diagonal:
+            self.offsets += (-width - 1, -width + 1, width - 1, width + 1)
+
+    def index(self, row, column):
+        """ Flat index of (row, column) """
+        return (row + 1) * self.width + column + 1
+
+    def position(self, index):
+        """ (row, column) of flat index """
+        row, column = divmod(index, self.width)
+        return row - 1, column - 1
+
+
+def manhattan_heuristic(grid, goal, scale=1):
+    """ Return a heuristic for flat indices of FlatGrid grid: the Manhattan distance to flat index goal, times scale
+        scale must not be more than the cheapest cost of a step for the heuristic to be consistent
+    """
+    width = grid.width
+    goal_row, goal_column = divmod(goal, width)
+
+    def heuristic(index):
+        row, column = divmod(index, width)
+        return (abs(row - goal_row) + abs(column - goal_column)) * scale
+    return heuristic
+
+
+def grid_search(costs, starts, goal, heuristic=True):
+    """ Find the cheapest path over a dense grid of integer costs, moving up, down, left and right
+        costs is a 2D NumPy array where costs[cell] is the cost of entering cell, and cells with a negative cost can
+        not be entered. starts is a list of (row, column) and goal is (row, column). With heuristic, use A* with a
+        Manhattan distance heuristic. Return the cost of the cheapest path, or None
+    """
+    grid = FlatGrid(costs, fill=-1)
+    cells = grid.cells
+    offsets = grid.offsets
+    passable = costs[costs >= 0]
+    min_cost = int(passable.min()) if passable.size else 0
+    _goal = grid.index(*goal)
+
+    def neighbours(index):
+        return [(_index, cells[_index]) for _index in [index + offset for offset in offsets] if cells[_index] >= 0]
+
+    def is_goal(index):
+        return index == _goal
+
+    _heuristic = manhattan_heuristic(grid, _goal, min_cost) if heuristic and min_cost > 0 else None
+    cost, _ = astar([grid.index(*start) for start in starts], neighbours, is_goal, _heuristic, bucket_queue=True)
+    return cost